@@ -0,0 +1,45 @@
+"""
+Builds an opening book (see Chess/OpeningBook.py) from PGN files, so the AI can play its first moves without
+searching. ChessMain.py and UCI.py use book.bin from the chess_v4 folder when it exists.
+
+    python BookBuilder.py games.pgn                          # writes book.bin
+    python BookBuilder.py a.pgn b.pgn --plies 16 --min-games 3 --book book.bin
+    python BookBuilder.py --probe "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+"""
+import argparse
+import sys
+import time
+from Chess.GameState import GameState
+from Chess.OpeningBook import OpeningBook, build_book
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'build an opening book from PGN games')
+    parser.add_argument('pgn', nargs = '*', help = 'PGN files to read')
+    parser.add_argument('--book', default = 'book.bin', help = 'book file to write (default book.bin)')
+    parser.add_argument('--plies', type = int, default = 20, help = 'plies of each game to put in the book (default 20)')
+    parser.add_argument('--min-games', type = int, default = 1, help = 'leave out moves played in fewer games (default 1)')
+    parser.add_argument('--probe', metavar = 'FEN', help = 'list the book moves of a position instead of building')
+    args = parser.parse_args()
+
+    if args.probe:
+        gs = GameState.from_fen(args.probe)
+        with OpeningBook(args.book) as book:
+            book_moves = book.get_moves(gs, gs.get_valid_moves())
+            total = sum(weight for _, weight in book_moves)
+            for move, weight in sorted(book_moves, key = lambda book_move: -book_move[1]):
+                print(f'{gs.get_san(move):8} weight {weight:6} ({100 * weight / total:.1f}%)')
+            if not book_moves:
+                print('not in book')
+        return 0
+
+    if not args.pgn:
+        parser.error('no PGN files given')
+    start = time.perf_counter()
+    games, entries = build_book(args.pgn, args.book, args.plies, args.min_games)
+    print(f'{games} games, {entries} book entries written to {args.book} in {time.perf_counter() - start:.1f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
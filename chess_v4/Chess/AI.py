@@ -1,151 +1,768 @@
+"""
+Alpha-beta search. A Searcher keeps everything a search needs (transposition table, move ordering tables, evaluator,
+statistics), so several games can be searched at the same time, each with its own Searcher.
+find_best_move searches with one shared Searcher for callers that only want a move; BackgroundSearch runs a search in
+a thread so the caller can keep going (eg. keep drawing the board) and cancel it. With an opening book loaded
+(load_opening_book), find_best_move plays book moves while the game is in book. A Searcher with a Tablebase plays
+endgames with few pieces left from the tables
+"""
+import copy
+import os
 import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from Chess.TranspositionTable import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+from Chess import PieceScores
+from Chess.PieceScores import piece_score
+from Chess.Evaluator import Evaluator, CHECKMATE, STALEMATE
+from Chess.OpeningBook import OpeningBook
+from Chess.Tablebase import count_pieces
+from Chess.MovePicker import MovePicker, QUIET_MOVES, capture_order_score
 
 
-piece_score = {'K': 0, 'Q': 10, 'R': 5, 'B': 3, 'N': 3, 'P': 1}
-
-knight_scores = [[0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0],
-                 [0.1, 0.3, 0.5, 0.5, 0.5, 0.5, 0.3, 0.1],
-                 [0.2, 0.5, 0.6, 0.65, 0.65, 0.6, 0.5, 0.2],
-                 [0.2, 0.55, 0.65, 0.7, 0.7, 0.65, 0.55, 0.2],
-                 [0.2, 0.5, 0.65, 0.7, 0.7, 0.65, 0.5, 0.2],
-                 [0.2, 0.55, 0.6, 0.65, 0.65, 0.6, 0.55, 0.2],
-                 [0.1, 0.3, 0.5, 0.55, 0.55, 0.5, 0.3, 0.1],
-                 [0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0]]
-
-bishop_scores = [[0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
-                 [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
-                 [0.2, 0.4, 0.5, 0.6, 0.6, 0.5, 0.4, 0.2],
-                 [0.2, 0.5, 0.5, 0.6, 0.6, 0.5, 0.5, 0.2],
-                 [0.2, 0.4, 0.6, 0.6, 0.6, 0.6, 0.4, 0.2],
-                 [0.2, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.2],
-                 [0.2, 0.5, 0.4, 0.4, 0.4, 0.4, 0.5, 0.2],
-                 [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0]]
-
-rook_scores = [[0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25],
-               [0.5, 0.75, 0.75, 0.75, 0.75, 0.75, 0.75, 0.5],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.25, 0.25, 0.25, 0.5, 0.5, 0.25, 0.25, 0.25]]
-
-queen_scores = [[0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0],
-                [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
-                [0.2, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
-                [0.3, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
-                [0.4, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
-                [0.2, 0.5, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
-                [0.2, 0.4, 0.5, 0.4, 0.4, 0.4, 0.4, 0.2],
-                [0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0]]
-
-pawn_scores = [[0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8],
-               [0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7],
-               [0.3, 0.3, 0.4, 0.5, 0.5, 0.4, 0.3, 0.3],
-               [0.25, 0.25, 0.3, 0.45, 0.45, 0.3, 0.25, 0.25],
-               [0.2, 0.2, 0.2, 0.4, 0.4, 0.2, 0.2, 0.2],
-               [0.25, 0.15, 0.1, 0.2, 0.2, 0.1, 0.15, 0.25],
-               [0.25, 0.3, 0.3, 0.0, 0.0, 0.3, 0.3, 0.25],
-               [0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2]]
-
-piece_position_scores = {"wN": knight_scores,
-                         "bN": knight_scores[::-1],
-                         "wB": bishop_scores,
-                         "bB": bishop_scores[::-1],
-                         "wQ": queen_scores,
-                         "bQ": queen_scores[::-1],
-                         "wR": rook_scores,
-                         "bR": rook_scores[::-1],
-                         "wP": pawn_scores,
-                         "bP": pawn_scores[::-1]}
-
-CHECKMATE = 1000 # white wins; black tries to minimize score
-STALEMATE = 0
+# raised inside the search when the time budget runs out or the search is stopped
+class SearchTimeout(Exception):
+    pass
+
+
+# move ordering
+MAX_PLY = 64
+HASH_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 100000 # captures and promotions, ordered by MVV-LVA
+KILLER_SCORE = 90000 # quiet moves that caused a cutoff at the same ply, quiet moves below are ordered by history
+
+# quiescence search: keep searching captures and promotions past the horizon until the position is quiet
+QUIESCENCE_NODE_LIMIT = 400 # most nodes one quiescence search may visit before it stands pat everywhere
+DELTA_MARGIN = 2 # skip captures that can't bring the score up to alpha even with this many pawns to spare
+
+# principal variation search: after the first move, moves are scouted with a null window just above alpha, which only
+# proves they are no better, and searched again with the real window when the scout fails high
+NULL_WINDOW = 0.001 # pawns; no wider than the smallest score difference the evaluation and tablebase scores make
+# aspiration windows: iterations after the first search a window this many pawns either side of the previous score,
+# widened (twice as far each time) on the side the score fell out of
+ASPIRATION_WINDOW = 0.5
+
+# selective search, each switchable with a Searcher option
+NULL_MOVE_REDUCTION = 2 # the null move is searched this many plies shallower than the real moves
+NULL_MOVE_MIN_DEPTH = 2 # remaining depth a node needs to try a null move
+LMR_MIN_DEPTH = 3 # late move reductions at nodes with at least this much depth left,
+LMR_MIN_MOVES = 3 # for the quiet moves after this many moves have been searched,
+LMR_REDUCTION = 1 # by this many plies
+
+# tablebase wins score just below a mate found by the search, less for every ply to mate so shorter wins are preferred
+TABLEBASE_WIN = CHECKMATE - 1
+
+# parallel search: the first root move is searched in the calling process to get a bound on the score, then the other
+# root moves are searched in worker processes with a window above that bound
+worker_pool = None # ProcessPoolExecutor, started by the first parallel search
+worker_pool_size = 0
+worker_searcher = None # the Searcher used by search_root_move inside a worker process
+
+
+# counters of one search
+class SearchStats:
+    def __init__(self):
+        self.nodes = 0 # alpha-beta nodes
+        self.quiescence_nodes = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.cutoffs = 0 # beta cutoffs
+        self.first_move_cutoffs = 0 # beta cutoffs on the first move searched
+        self.interior_nodes = 0 # nodes where moves were searched
+        self.quiet_generations = 0 # interior nodes whose move picker got as far as generating the quiet moves
+        self.tablebase_hits = 0 # nodes scored from the tablebase
+        self.scouts = 0 # null window searches of moves after the first
+        self.re_searches = 0 # scouts that failed high and had to be searched again with the full window
+        self.aspiration_re_searches = 0 # root searches repeated because the score fell outside the aspiration window
+        self.null_moves = 0 # null moves searched
+        self.null_move_cutoffs = 0 # nodes cut off by the null move
+        self.reductions = 0 # late moves searched at a reduced depth
+        self.reduction_re_searches = 0 # reduced moves that beat alpha and were searched again at full depth
+        self.check_extensions = 0 # nodes in check searched a ply deeper
+        self.elapsed = 0 # seconds
+        self.worker_nodes = {} # process id -> nodes searched by that process (parallel searches)
+
+    def total_nodes(self):
+        return self.nodes + self.quiescence_nodes
+
+    # nodes per second
+    def nps(self):
+        return self.total_nodes() / self.elapsed if self.elapsed > 0 else 0
+
+    # add the counts of a search done by a worker process
+    def add(self, other):
+        self.nodes += other.nodes
+        self.quiescence_nodes += other.quiescence_nodes
+        self.tt_probes += other.tt_probes
+        self.tt_hits += other.tt_hits
+        self.cutoffs += other.cutoffs
+        self.first_move_cutoffs += other.first_move_cutoffs
+        self.interior_nodes += other.interior_nodes
+        self.quiet_generations += other.quiet_generations
+        self.tablebase_hits += other.tablebase_hits
+        self.scouts += other.scouts
+        self.re_searches += other.re_searches
+        self.aspiration_re_searches += other.aspiration_re_searches
+        self.null_moves += other.null_moves
+        self.null_move_cutoffs += other.null_move_cutoffs
+        self.reductions += other.reductions
+        self.reduction_re_searches += other.reduction_re_searches
+        self.check_extensions += other.check_extensions
+
+    # cutoff rate, how often the first move was good enough for the cutoff and how often the quiet moves were needed
+    def ordering_stats(self):
+        cutoff_rate = 100 * self.cutoffs / self.interior_nodes if self.interior_nodes else 0
+        first_move_rate = 100 * self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0
+        quiet_rate = 100 * self.quiet_generations / self.interior_nodes if self.interior_nodes else 0
+        return f'{cutoff_rate:.1f}% of nodes cut off, {first_move_rate:.1f}% on the first move, ' \
+               f'quiet moves generated at {quiet_rate:.1f}%'
+
+    # how often the scouts and the aspiration windows were wrong and a search had to be repeated
+    def re_search_stats(self):
+        re_search_rate = 100 * self.re_searches / self.scouts if self.scouts else 0
+        return f'{re_search_rate:.1f}% of {self.scouts} scouts re-searched, {self.aspiration_re_searches} aspiration re-searches'
+
+    # how much the null moves, late move reductions and check extensions did
+    def selectivity_stats(self):
+        null_move_rate = 100 * self.null_move_cutoffs / self.null_moves if self.null_moves else 0
+        reduction_rate = 100 * self.reduction_re_searches / self.reductions if self.reductions else 0
+        return f'{null_move_rate:.1f}% of {self.null_moves} null moves cut off, {reduction_rate:.1f}% of ' \
+               f'{self.reductions} reduced moves re-searched, {self.check_extensions} check extensions'
+
+    def __str__(self):
+        hit_rate = 100 * self.tt_hits / self.tt_probes if self.tt_probes else 0
+        return f'analyzed {self.nodes} board states ({self.quiescence_nodes} in quiescence search) in {self.elapsed * 1000:.0f} ms, ' \
+               f'{self.nps():.0f} nodes/s, {self.ordering_stats()}, {self.re_search_stats()}, {self.selectivity_stats()}, ' \
+               f'{hit_rate:.1f}% hash hits'
+
+
+# what a search found; score is in pawns from the point of view of the side to move
+class SearchResult:
+    def __init__(self, best_move, score, depth, principal_variation, stats):
+        self.best_move = best_move
+        self.score = score
+        self.depth = depth # depth of the deepest completed iteration
+        self.principal_variation = principal_variation # list of moves starting with best_move
+        self.stats = stats
+
+    def __str__(self):
+        pv = ' '.join(str(move) for move in self.principal_variation)
+        return f'{self.best_move} ({self.score:+.2f}) at depth {self.depth}, pv {pv}, {self.stats}'
+
+
+class Searcher:
+    # evaluator: static evaluation used at the leaves, eg. Evaluator(mobility_weight = 0.05) (default Evaluator())
+    # hash_size: transposition table slots
+    # shuffle_root_moves: vary the choice between equally good moves; turn off to make searches repeatable
+    # workers: with more than 1 the root moves are split between that many processes (see parallel_root_search)
+    # tablebase: a Tablebase to score positions with few pieces left, at the root and inside the search
+    # use_pvs: principal variation search (null window scouts for the moves after the first)
+    # aspiration_window: half width in pawns of the root window around the previous iteration's score; 0 searches every
+    # iteration with the full window (the parallel root search always does)
+    # use_null_move, use_late_move_reductions, use_check_extensions: the selective search, see nega_max_alpha_beta
+    def __init__(self, evaluator = None, hash_size = 1 << 18, use_quiescence = True, shuffle_root_moves = True, workers = 1,
+                 tablebase = None, use_pvs = True, aspiration_window = ASPIRATION_WINDOW, use_null_move = True,
+                 use_late_move_reductions = True, use_check_extensions = True):
+        self.evaluator = evaluator if evaluator is not None else Evaluator()
+        # positions searched so far, kept between searches so the next move can reuse the work
+        self.transposition_table = TranspositionTable(hash_size)
+        self.use_quiescence = use_quiescence
+        self.shuffle_root_moves = shuffle_root_moves
+        self.workers = workers
+        self.killer_moves = [[None, None] for _ in range(MAX_PLY)] # the last two quiet moves that caused a beta cutoff at each ply
+        self.history = {} # (piece_moved, end_row, end_col) -> how much quiet moves like this have caused cutoffs
+        self.stats = SearchStats() # counters of the current (or last) search
+        self.deadline = None # time.perf_counter() value when a timed search has to stop
+        self.stop_event = None # threading.Event that stops the search when set (see search)
+        self.node_limit = None # nodes after which the search stops
+        self.depth = 0 # depth of the iteration being searched
+        self.next_move = None # best root move of the current iteration
+        self.quiescence_budget = 0 # nodes left for the current quiescence search
+        self.tablebase = tablebase
+        self.pieces = 0 # pieces on the board at the node being searched, to know when to probe the tablebase
+        self.use_pvs = use_pvs
+        self.aspiration_window = aspiration_window
+        self.use_null_move = use_null_move
+        self.use_late_move_reductions = use_late_move_reductions
+        self.use_check_extensions = use_check_extensions
+        self.after_null_move = False # set for the node right after a null move
+
+    # search to max_depth and return a SearchResult
+    # with time_limit (milliseconds) it searches depth 1, 2, 3... up to max_depth and returns the best move of the
+    # deepest iteration that finished in time
+    # setting stop_event (a threading.Event, eg. from another thread) ends the search like running out of time; the
+    # result then holds the deepest completed iteration, with best_move None if there wasn't one
+    # node_limit stops the search after about that many nodes, like time_limit
+    # iterative_deepening searches depth 1, 2, 3... even without a time limit (it is on when time_limit or node_limit
+    # is given); report, if given, is called with a SearchResult after every completed iteration
+    def search(self, gs, valid_moves, max_depth, time_limit = None, stop_event = None, node_limit = None, report = None,
+               iterative_deepening = None):
+        self.next_move = None
+        self.stop_event = stop_event
+        if iterative_deepening is None:
+            iterative_deepening = time_limit is not None or node_limit is not None
+        if self.shuffle_root_moves:
+            random.shuffle(valid_moves) # vary the choice between equally ordered moves from game to game
+        self.stats = SearchStats()
+        probes, hits = self.transposition_table.probes, self.transposition_table.hits
+        self.transposition_table.new_search()
+        self.reset_move_ordering()
+        start_time = time.perf_counter()
+        best_move = None
+        best_score = 0
+        depth_reached = 0
+        moves_made = len(gs.move_log)
+        tablebase_move = self.find_tablebase_move(gs, valid_moves)
+        if tablebase_move is not None:
+            best_move, best_score = tablebase_move
+            self.stats.elapsed = time.perf_counter() - start_time
+            result = SearchResult(best_move, best_score, 1, [best_move], self.stats)
+            if report is not None:
+                report(result)
+            self.stop_event = None
+            return result
+        first_depth = 1 if iterative_deepening else max_depth
+        for depth in range(first_depth, max_depth + 1):
+            # depth 1 always runs to completion (unless stop_event is set) so there is a move to return
+            self.deadline = None if time_limit is None or depth == 1 else start_time + time_limit / 1000
+            self.node_limit = None if depth == 1 else node_limit
+            self.depth = depth
+            try:
+                if depth > first_depth and self.aspiration_window and self.workers <= 1 and abs(best_score) < TABLEBASE_WIN - 1:
+                    score = self.aspiration_search(gs, valid_moves, depth, best_score)
+                else:
+                    score = self.search_root(gs, valid_moves, depth)
+            except SearchTimeout:
+                while len(gs.move_log) > moves_made: # take back the moves of the unfinished search
+                    gs.undo_move()
+                break
+            best_move = self.next_move
+            best_score = score
+            depth_reached = depth
+            if report is not None:
+                self.stats.elapsed = time.perf_counter() - start_time
+                report(SearchResult(best_move, best_score, depth, self.get_principal_variation(gs, depth), self.stats))
+            # next_move is kept, so the root searches it first in the next iteration; the rest of the principal
+            # variation comes first through the hash moves
+            if time_limit is not None and time.perf_counter() - start_time >= time_limit / 1000:
+                break
+        self.deadline = None
+        self.stop_event = None
+        self.node_limit = None
+        self.stats.elapsed = time.perf_counter() - start_time
+        self.stats.tt_probes += self.transposition_table.probes - probes
+        self.stats.tt_hits += self.transposition_table.hits - hits
+        return SearchResult(best_move, best_score, depth_reached, self.get_principal_variation(gs, depth_reached), self.stats)
+
+    # one iteration at the root; sets next_move and returns the score
+    def search_root(self, gs, valid_moves, depth, alpha = -CHECKMATE, beta = CHECKMATE):
+        self.pieces = count_pieces(gs)
+        if self.workers > 1:
+            return self.parallel_root_search(gs, valid_moves, depth)
+        return self.nega_max_alpha_beta(gs, valid_moves, depth, 0, alpha, beta, 1 if gs.white_to_move else -1)
+
+    # one iteration at the root with an aspiration window around previous_score. A score outside the window is only a
+    # bound, so the window is widened on that side and the root searched again until the score lands inside it
+    def aspiration_search(self, gs, valid_moves, depth, previous_score):
+        delta = self.aspiration_window
+        alpha, beta = max(previous_score - delta, -CHECKMATE), min(previous_score + delta, CHECKMATE)
+        while True:
+            score = self.search_root(gs, valid_moves, depth, alpha, beta)
+            if score <= alpha and alpha > -CHECKMATE:
+                alpha = max(score - delta * 2, -CHECKMATE)
+            elif score >= beta and beta < CHECKMATE:
+                beta = min(score + delta * 2, CHECKMATE)
+            else:
+                return score
+            self.stats.aspiration_re_searches += 1
+            delta *= 2
+
+    # search the root with the work split between processes. The first (best ordered) move is searched here, which
+    # gives a lower bound on the score; every other root move is sent to the worker pool and searched with a window
+    # above that bound, so moves that aren't better fail low quickly. Ties go to the move that was ordered first, the
+    # same choice the serial search makes. Sets next_move and raises SearchTimeout if a worker ran out of time
+    def parallel_root_search(self, gs, valid_moves, depth):
+        stats = self.stats
+        turn_multiplier = 1 if gs.white_to_move else -1
+        if len(valid_moves) < 2: # nothing to split
+            return self.nega_max_alpha_beta(gs, valid_moves, depth, 0, -CHECKMATE, CHECKMATE, turn_multiplier)
+        entry = self.transposition_table.probe(gs.zobrist_key)
+        hash_move = entry[4] if entry is not None else None
+        if hash_move is None:
+            hash_move = self.next_move # best move of the previous iteration
+        valid_moves = self.order_moves(valid_moves, hash_move, 0)
+        stats.nodes += 1
+        stats.interior_nodes += 1
+
+        nodes_before = stats.total_nodes()
+        gs.make_move(valid_moves[0])
+        self.pieces = count_pieces(gs)
+        best_score = -self.nega_max_alpha_beta(gs, None, depth - 1, 1, -CHECKMATE, CHECKMATE, -turn_multiplier)
+        gs.undo_move()
+        best_move = valid_moves[0]
+        pid = os.getpid()
+        stats.worker_nodes[pid] = stats.worker_nodes.get(pid, 0) + stats.total_nodes() - nodes_before
+
+        pool = get_worker_pool(self.workers)
+        futures = [pool.submit(search_root_move, gs, move, depth, best_score, self.deadline, self.transposition_table.age,
+                               self.evaluator, self.search_switches(), self.tablebase) for move in valid_moves[1:]]
+        timed_out = False
+        for move, future in zip(valid_moves[1:], futures): # in move order, so the first of equal scores wins
+            pid, score, worker_stats = future.result()
+            stats.add(worker_stats)
+            stats.worker_nodes[pid] = stats.worker_nodes.get(pid, 0) + worker_stats.total_nodes()
+            if score is None:
+                timed_out = True
+            elif score > best_score:
+                best_score = score
+                best_move = move
+        if timed_out:
+            for future in futures: # don't start the moves still waiting for a worker
+                future.cancel()
+            raise SearchTimeout()
+        self.next_move = best_move
+        self.transposition_table.store(gs.zobrist_key, depth, best_score, EXACT, best_move)
+        return best_score
+
+    # (move, score) for a root position in the tablebase: the fastest win, else a draw, else the slowest loss. None if
+    # there is no tablebase or the position (or a position after one of the moves) isn't in it
+    def find_tablebase_move(self, gs, valid_moves):
+        if self.tablebase is None or not valid_moves or count_pieces(gs) > self.tablebase.max_pieces:
+            return None
+        best_move = None
+        best_score = None
+        for move in valid_moves:
+            gs.make_move(move)
+            probe = self.tablebase.probe(gs)
+            gs.undo_move()
+            if probe is None:
+                return None
+            score = -tablebase_score(*probe)
+            if best_score is None or score > best_score:
+                best_move, best_score = move, score
+        self.stats.tablebase_hits += len(valid_moves)
+        self.next_move = best_move
+        return best_move, best_score
+
+    # the on/off settings of the search, to pass on to worker processes
+    def search_switches(self):
+        return {'use_quiescence': self.use_quiescence, 'use_pvs': self.use_pvs, 'use_null_move': self.use_null_move,
+                'use_late_move_reductions': self.use_late_move_reductions, 'use_check_extensions': self.use_check_extensions}
+
+    # clear the killer moves and age the history scores before a new search
+    def reset_move_ordering(self):
+        for killers in self.killer_moves:
+            killers[0] = killers[1] = None
+        for key in self.history:
+            self.history[key] //= 8
+
+    # sort the moves so the ones most likely to cause a cutoff are searched first:
+    # hash move, captures/promotions by MVV-LVA, killer moves, then quiet moves by history
+    def order_moves(self, valid_moves, hash_move, ply):
+        killers = self.killer_moves[ply] if ply < MAX_PLY else (None, None)
+        history = self.history
+
+        def move_order_score(move):
+            if move == hash_move:
+                return HASH_MOVE_SCORE
+            if move.is_capture or move.promoted_piece is not None:
+                return CAPTURE_SCORE + capture_order_score(move)
+            if move == killers[0]:
+                return KILLER_SCORE + 1
+            if move == killers[1]:
+                return KILLER_SCORE
+            return history.get((move.piece_moved, move.end_row, move.end_col), 0)
+
+        return sorted(valid_moves, key = move_order_score, reverse = True)
+
+    # remember a quiet move that caused a beta cutoff
+    def update_killers_and_history(self, move, ply, depth):
+        if ply < MAX_PLY and self.killer_moves[ply][0] != move:
+            self.killer_moves[ply][1] = self.killer_moves[ply][0]
+            self.killer_moves[ply][0] = move
+        key = (move.piece_moved, move.end_row, move.end_col)
+        self.history[key] = min(self.history.get(key, 0) + depth * depth, KILLER_SCORE - 1)
+
+    # follow the best moves stored in the transposition table from the current position
+    def get_principal_variation(self, gs, max_depth):
+        pv = []
+        for _ in range(max_depth):
+            entry = self.transposition_table.probe(gs.zobrist_key)
+            if entry is None or entry[4] is None or entry[4] not in gs.get_valid_moves():
+                break
+            gs.make_move(entry[4])
+            pv.append(entry[4])
+        for _ in pv:
+            gs.undo_move()
+        return pv
+
+    # valid_moves is the move list at the root; below it, it is None and the moves are generated when they are needed,
+    # by a MovePicker at interior nodes. ply counts the moves from the root (reductions and extensions mean it can't be
+    # worked out from curr_depth)
+    def nega_max_alpha_beta(self, gs, valid_moves, curr_depth, ply, alpha, beta, turn_multiplier):
+        null_move_allowed = not self.after_null_move # no two null moves in a row
+        self.after_null_move = False
+        stats = self.stats
+        stats.nodes += 1
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise SearchTimeout()
+        if self.node_limit is not None and self.stats.nodes + self.stats.quiescence_nodes >= self.node_limit:
+            raise SearchTimeout()
+        key = gs.zobrist_key
+        alpha_original = alpha
+
+        # extend before the transposition table lookup, the entries are stored with the extended depth
+        in_check = False
+        if ply != 0 and (self.use_check_extensions or self.use_null_move or self.use_late_move_reductions):
+            in_check = gs.is_in_check()
+            if in_check and self.use_check_extensions and ply < MAX_PLY: # search the evasions one ply deeper
+                stats.check_extensions += 1
+                curr_depth += 1
+
+        # look up the position in the transposition table
+        hash_move = None
+        entry = self.transposition_table.probe(key)
+        if entry is not None:
+            hash_move = entry[4]
+            if entry[1] >= curr_depth and ply != 0: # never cut off at the root, we need a move there
+                score = entry[2]
+                if entry[3] == EXACT:
+                    return score
+                elif entry[3] == LOWER_BOUND:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+
+        if self.tablebase is not None and ply != 0 and self.pieces <= self.tablebase.max_pieces:
+            probe = self.tablebase.probe(gs)
+            if probe is not None:
+                stats.tablebase_hits += 1
+                return tablebase_score(*probe)
+
+        if curr_depth == 0:
+            if valid_moves is None: # the evaluation and the quiescence search start from the full move list
+                valid_moves = gs.get_valid_moves()
+            if not self.use_quiescence:
+                score = turn_multiplier * self.evaluator.evaluate(gs, valid_moves)
+                self.transposition_table.store(key, 0, score, EXACT, None)
+                return score
+            self.quiescence_budget = QUIESCENCE_NODE_LIMIT
+            score = self.quiescence_search(gs, valid_moves, alpha, beta, turn_multiplier)
+            if score <= alpha_original:
+                bound = UPPER_BOUND
+            elif score >= beta:
+                bound = LOWER_BOUND
+            else:
+                bound = EXACT
+            self.transposition_table.store(key, 0, score, bound, None)
+            return score
+
+        # null move pruning: if passing the turn and searching shallower still scores at least beta, a real move
+        # almost certainly would too. Not in check, not after a null move, not when beta is a mate score and not
+        # with only king and pawns, where zugzwang makes passing better than any move
+        if self.use_null_move and null_move_allowed and ply != 0 and not in_check and curr_depth >= NULL_MOVE_MIN_DEPTH \
+                and beta < TABLEBASE_WIN - 1 and turn_multiplier * self.evaluator.evaluate_material(gs) >= beta \
+                and gs.has_non_pawn_material():
+            stats.null_moves += 1
+            gs.make_null_move()
+            moves_made = len(gs.move_log)
+            self.after_null_move = True
+            try:
+                score = -self.nega_max_alpha_beta(gs, None, max(curr_depth - 1 - NULL_MOVE_REDUCTION, 0), ply + 1,
+                                                  -beta, -beta + NULL_WINDOW, -turn_multiplier)
+            except SearchTimeout: # the moves made below the null move have to be taken back before it
+                while len(gs.move_log) > moves_made:
+                    gs.undo_move()
+                gs.undo_null_move()
+                raise
+            gs.undo_null_move()
+            if score >= beta:
+                stats.null_move_cutoffs += 1
+                return beta if score >= TABLEBASE_WIN - 1 else score # don't trust a mate found by passing
+
+        if hash_move is None and ply == 0:
+            hash_move = self.next_move # best move of the previous iteration
+        if valid_moves is not None:
+            picker = None
+            moves = self.order_moves(valid_moves, hash_move, ply)
+        else:
+            picker = MovePicker(gs, hash_move, self.killer_moves[ply] if ply < MAX_PLY else (None, None), self.history)
+            moves = picker
+        stats.interior_nodes += 1
+
+        max_score = -CHECKMATE
+        best_move = None
+        pieces = self.pieces
+        scout = self.use_pvs and beta - alpha > 2 * NULL_WINDOW # the window isn't a null window already
+        reduce_late_moves = self.use_late_move_reductions and picker is not None and not in_check and curr_depth >= LMR_MIN_DEPTH
+        i = -1
+        for i, move in enumerate(moves):
+            gs.make_move(move)
+            self.pieces = pieces - 1 if move.is_capture else pieces
+            # late move reductions: quiet moves ordered this late rarely beat alpha, so scout them at a reduced depth
+            # first and only search them fully if they do
+            reduced = reduce_late_moves and i >= LMR_MIN_MOVES and picker.stage == QUIET_MOVES and not gs.is_in_check()
+            if reduced:
+                stats.reductions += 1
+                score = -self.nega_max_alpha_beta(gs, None, curr_depth - 1 - LMR_REDUCTION, ply + 1, -alpha - NULL_WINDOW,
+                                                  -alpha, -turn_multiplier)
+                if score > alpha:
+                    stats.reduction_re_searches += 1
+            if not reduced or score > alpha:
+                if i == 0 or not scout:
+                    score = -self.nega_max_alpha_beta(gs, None, curr_depth - 1, ply + 1, -beta, -alpha, -turn_multiplier)
+                else:
+                    stats.scouts += 1
+                    score = -self.nega_max_alpha_beta(gs, None, curr_depth - 1, ply + 1, -alpha - NULL_WINDOW, -alpha,
+                                                      -turn_multiplier)
+                    if alpha < score < beta: # better than the moves before it after all, get its real score
+                        stats.re_searches += 1
+                        score = -self.nega_max_alpha_beta(gs, None, curr_depth - 1, ply + 1, -beta, -alpha, -turn_multiplier)
+            if score > max_score:
+                max_score = score
+                best_move = move
+                if ply == 0:
+                    self.next_move = move
+            gs.undo_move()
+            if max_score > alpha:
+                alpha = max_score
+            if alpha >= beta:
+                stats.cutoffs += 1
+                if i == 0:
+                    stats.first_move_cutoffs += 1
+                if not move.is_capture and move.promoted_piece is None:
+                    self.update_killers_and_history(move, ply, curr_depth)
+                break
+        self.pieces = pieces
+        if picker is not None and picker.stage >= QUIET_MOVES:
+            stats.quiet_generations += 1
+        if i < 0 and not gs.in_check: # no legal moves and not in check (the picker generated every move to find out)
+            max_score = STALEMATE
+
+        if max_score <= alpha_original:
+            bound = UPPER_BOUND
+        elif max_score >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.transposition_table.store(key, curr_depth, max_score, bound, best_move)
+        return max_score
+
+    # search only captures and promotions (all moves when in check) until the position is quiet, so the score at the
+    # horizon isn't taken in the middle of an exchange. valid_moves is the full move list at the horizon node and None below it
+    def quiescence_search(self, gs, valid_moves, alpha, beta, turn_multiplier):
+        self.stats.quiescence_nodes += 1
+        self.quiescence_budget -= 1
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise SearchTimeout()
+        if self.node_limit is not None and self.stats.nodes + self.stats.quiescence_nodes >= self.node_limit:
+            raise SearchTimeout()
+
+        # every ply stands pat on the same full evaluation as the horizon node, so the captures are scored on the scale
+        # of the position they come from; its move based terms need every move, not just the captures
+        if valid_moves is None:
+            valid_moves = gs.get_valid_moves()
+        stand_pat = turn_multiplier * self.evaluator.evaluate(gs, valid_moves)
+        if gs.checkmate or gs.stalemate or self.quiescence_budget <= 0:
+            return stand_pat
+        in_check = gs.in_check
+        moves = valid_moves if in_check else [move for move in valid_moves if move.is_capture or move.promoted_piece is not None]
+
+        if in_check: # no standing pat when in check
+            max_score = -CHECKMATE
+        else:
+            max_score = stand_pat
+            if max_score >= beta:
+                return max_score
+            if max_score > alpha:
+                alpha = max_score
+
+        for move in self.order_moves(moves, None, MAX_PLY):
+            # delta pruning: even winning the captured piece for free wouldn't reach alpha. Not for captures that give
+            # check, the side in check can't stand pat so they can win more than the piece. The skipped capture may
+            # still score up to delta_score, so the score returned on a fail low can't be lower than that
+            hopeless = False
+            if not in_check and move.promoted_piece is None:
+                delta_score = stand_pat + piece_score[move.piece_captured[1]] + DELTA_MARGIN
+                hopeless = delta_score <= alpha
+            gs.make_move(move)
+            if hopeless and not gs.is_in_check():
+                gs.undo_move()
+                if delta_score > max_score:
+                    max_score = delta_score
+                continue
+            score = -self.quiescence_search(gs, None, -beta, -alpha, -turn_multiplier)
+            gs.undo_move()
+            if score > max_score:
+                max_score = score
+            if max_score > alpha:
+                alpha = max_score
+            if alpha >= beta:
+                break
+        return max_score
+
+
+# runs Searcher.search on a copy of the game state in a daemon thread, so the game state can still be drawn (and
+# changed) while the search runs. Poll done() and read result when it is, or cancel() to stop the search and drop it.
+# options are passed on to Searcher.search (eg. node_limit, report); on_done is called with the SearchResult from the
+# search thread when the search ends, whether it finished or was stopped
+class BackgroundSearch:
+    def __init__(self, searcher, gs, max_depth, time_limit = None, on_done = None, **options):
+        self.searcher = searcher
+        self.result = None # SearchResult, once done
+        self.stop_event = threading.Event()
+        self.on_done = on_done
+        gs = copy.deepcopy(gs) # the search makes and takes back moves on its own copy
+        self.thread = threading.Thread(target = self.run, args = (gs, max_depth, time_limit, options), daemon = True)
+        self.thread.start()
+
+    def run(self, gs, max_depth, time_limit, options):
+        self.result = self.searcher.search(gs, gs.get_valid_moves(), max_depth, time_limit, self.stop_event, **options)
+        if self.on_done is not None:
+            self.on_done(self.result)
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    # stop the search, wait for the thread to finish and throw away the result
+    def cancel(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.result = None
+
+    # stop the search early and keep the best move found so far (see Searcher.search)
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        return self.result
+
+
+# the pool of worker processes for parallel_root_search, started again if the number of workers changes
+def get_worker_pool(workers):
+    global worker_pool, worker_pool_size
+    if worker_pool is None or worker_pool_size != workers:
+        shutdown_worker_pool()
+        worker_pool = ProcessPoolExecutor(max_workers = workers)
+        worker_pool_size = workers
+    return worker_pool
+
+
+def shutdown_worker_pool():
+    global worker_pool, worker_pool_size
+    if worker_pool is not None:
+        worker_pool.shutdown()
+    worker_pool = None
+    worker_pool_size = 0
+
+
+# runs in a worker process: the score of one root move, searched with the window (alpha, CHECKMATE) from the root's
+# point of view. Every worker process keeps one Searcher (and so one transposition table) for all the searches it
+# helps with; the settings of the Searcher that started the search are passed along.
+# Returns (process id, score or None if the deadline passed, SearchStats)
+def search_root_move(gs, move, depth, alpha, deadline, age, evaluator, switches, tablebase):
+    global worker_searcher
+    if worker_searcher is None:
+        worker_searcher = Searcher(shuffle_root_moves = False)
+    searcher = worker_searcher
+    searcher.deadline = deadline # perf_counter is a system wide clock, so the deadline means the same thing here
+    searcher.evaluator = evaluator
+    for name, value in switches.items():
+        setattr(searcher, name, value)
+    searcher.tablebase = tablebase
+    if searcher.transposition_table.age != age: # first move of a new search in this process
+        searcher.transposition_table.age = age
+        searcher.reset_move_ordering()
+    searcher.stats = SearchStats()
+    probes, hits = searcher.transposition_table.probes, searcher.transposition_table.hits
+    turn_multiplier = 1 if gs.white_to_move else -1
+    gs.make_move(move)
+    searcher.pieces = count_pieces(gs)
+    try:
+        score = -searcher.nega_max_alpha_beta(gs, None, depth - 1, 1, -CHECKMATE, -alpha, -turn_multiplier)
+    except SearchTimeout:
+        score = None
+    searcher.stats.tt_probes = searcher.transposition_table.probes - probes
+    searcher.stats.tt_hits = searcher.transposition_table.hits - hits
+    return os.getpid(), score, searcher.stats
+
+
+# score of a tablebase result (wdl, dtm) for the side to move, in pawns
+def tablebase_score(wdl, dtm):
+    if wdl == 0:
+        return STALEMATE
+    return wdl * (TABLEBASE_WIN - dtm / 1000)
+
+
+# searcher used by find_best_move
+searcher = Searcher()
+# the module level settings and results of the search before it moved into Searcher, kept for existing callers:
+# find_best_move hands evaluator and use_quiescence (replace them to change its search) to the shared searcher and
+# sets depth_reached and principal_variation from its result
+evaluator = searcher.evaluator
+use_quiescence = True
+depth_reached = 0 # depth of the last completed iteration
+principal_variation = [] # best line found by the last search
+# the piece-square tables that were defined here before they moved to PieceScores
+knight_scores = PieceScores.knight_scores
+bishop_scores = PieceScores.bishop_scores
+rook_scores = PieceScores.rook_scores
+queen_scores = PieceScores.queen_scores
+pawn_scores = PieceScores.pawn_scores
+piece_position_scores = PieceScores.piece_position_scores
+# OpeningBook used by find_best_move and find_book_move, None to always search
+opening_book = None
+
+
+def load_opening_book(path):
+    global opening_book
+    if opening_book is not None:
+        opening_book.close()
+    opening_book = OpeningBook(path)
+    return opening_book
+
+
+# a move from the opening book, or None if no book is loaded or the position isn't in it
+def find_book_move(gs, valid_moves):
+    if opening_book is None:
+        return None
+    return opening_book.choose_move(gs, valid_moves)
+
 
 # picks and returns a random move
 def find_random_move(valid_moves):
     return valid_moves[random.randint(0, len(valid_moves) - 1)]
 
 
+# a book move while in book, otherwise the best move found by the shared Searcher (see Searcher.search)
+def find_best_move(gs, valid_moves, max_depth, time_limit = None, workers = 1):
+    global depth_reached, principal_variation
+    book_move = find_book_move(gs, valid_moves)
+    if book_move is not None:
+        return book_move
+    searcher.workers = workers
+    searcher.evaluator = evaluator
+    searcher.use_quiescence = use_quiescence
+    result = searcher.search(gs, valid_moves, max_depth, time_limit)
+    depth_reached = result.depth
+    principal_variation = result.principal_variation
+    return result.best_move
 
-# helper method to make the first recursive call
-def find_best_move(gs, valid_moves, max_depth):
-    global next_move, counter
-    next_move = None
-    random.shuffle(valid_moves)
-    counter = 0
-    find_move_nega_max_alpha_beta(gs, valid_moves, max_depth, max_depth, -CHECKMATE, CHECKMATE, 1 if gs.white_to_move else -1)
-    print(f'Analyzed {counter} board states')
-    return next_move
- 
 
+# score the position from white's point of view with the evaluator find_best_move uses
 def score_board(gs, valid_moves):
-    if gs.checkmate:
-        if gs.white_to_move:
-            return -CHECKMATE # black wins
-        else:
-            return CHECKMATE # white wins
-    elif gs.stalemate:
-        return STALEMATE
-    
-    score = 0
-    for row in range(len(gs.board)):
-        for col in range(len(gs.board[row])):
-            piece = gs.board[row][col]
-            if piece != '--':
-                # score it positionally
-                piece_position_score = 0
-                if piece[1] != 'K':
-                    piece_position_score = piece_position_scores[piece][row][col]
-                if piece[0] == 'w':
-                    score += piece_score[piece[1]] + piece_position_score
-                if piece[0] == 'b':
-                    score -= piece_score[piece[1]] + piece_position_score
-            if piece[0] == 'w':
-                score += piece_score[piece[1]]
-            elif piece[0] == 'b':
-                score -= piece_score[piece[1]]
-    
-    for move in valid_moves:
-        if gs.white_to_move: 
-            gs.make_move(move) # will switch players
-            in_check, _, _ = gs.check_for_pins_and_checks()
-            if gs.checkmate: # black is checkmated
-                score += 1000
-            elif in_check: # black is in check
-                score += 0.7
-        elif not gs.white_to_move:
-            gs.make_move(move) # will switch players
-            in_check, _, _ = gs.check_for_pins_and_checks()
-            if gs.checkmate: # white is checkmated
-                score -= 1000
-            elif in_check: # white is in check
-                score -= 0.7
-                
-        gs.undo_move()
-    
-    
-    return score
+    return evaluator.evaluate(gs, valid_moves)
 
+
+# the negamax search of the shared searcher with its original arguments: curr_depth plies left of a search to
+# max_depth, so the node is max_depth - curr_depth plies from the root
 def find_move_nega_max_alpha_beta(gs, valid_moves, curr_depth, max_depth, alpha, beta, turn_multiplier):
-    global next_move, counter
-    DEPTH = max_depth
-    counter += 1
-    if curr_depth == 0:
-        return turn_multiplier * score_board(gs, valid_moves)
-    max_score = -CHECKMATE
-    for move in valid_moves:
-        gs.make_move(move)
-        next_moves = gs.get_valid_moves()
-        score = -find_move_nega_max_alpha_beta(gs, next_moves, curr_depth - 1, DEPTH, -beta, -alpha, -turn_multiplier)
-        if score > max_score:
-            max_score = score
-            if curr_depth == DEPTH:
-                next_move = move
-                #print(f'move: {move}, score: {score}')
-        gs.undo_move()
-        if max_score > alpha:
-            alpha = max_score
-        if alpha >= beta:
-            break
-    return max_score
+    searcher.evaluator = evaluator
+    searcher.use_quiescence = use_quiescence
+    return searcher.nega_max_alpha_beta(gs, valid_moves, curr_depth, max_depth - curr_depth, alpha, beta, turn_multiplier)
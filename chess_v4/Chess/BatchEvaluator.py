@@ -0,0 +1,73 @@
+"""
+Material and piece-square scores for many positions at once with NumPy, for offline analysis of large position sets.
+Boards are encoded as an (N, 64) int8 array of piece codes (0 for an empty square, 1-12 for the pieces in FEN order
+PNBRQKpnbrqk; squares are numbered a8 = 0 to h1 = 63 like GameState.board) or as (N, 12, 64) one-hot planes, and
+scored against stacked tables of the values in PieceScores. The scores are in centipawns from white's point of view
+and are exactly the static terms of Evaluator (gs.material_score + gs.position_score); divide them by 100 for pawns.
+
+    from Chess import BatchEvaluator
+    scores = BatchEvaluator.evaluate_fens(fens)
+"""
+import numpy as np
+from Chess.GameState import FEN_PIECES
+from Chess.PieceScores import piece_values, piece_square_values
+
+PIECE_NAMES = [('w' if letter.isupper() else 'b') + letter.upper() for letter in FEN_PIECES] # 'wP' ... 'bK'
+
+# SQUARE_VALUES[code, square]: centipawns of that piece on that square (material plus piece-square score, black
+# negated); row 0 is the empty square. WEIGHTS is the same without the empty row, flattened to match one-hot planes
+SQUARE_VALUES = np.zeros((13, 64), dtype = np.int32)
+for code, name in enumerate(PIECE_NAMES, 1):
+    for square in range(64):
+        SQUARE_VALUES[code, square] = piece_values[name] + piece_square_values[name][square // 8][square % 8]
+WEIGHTS = SQUARE_VALUES[1:].reshape(12 * 64)
+
+# byte -> piece code, for the FEN piece letters and the '.' empty squares of an expanded board string
+FEN_CODES = np.zeros(256, dtype = np.int8)
+for code, letter in enumerate(FEN_PIECES, 1):
+    FEN_CODES[ord(letter)] = code
+# (color byte << 8 | piece byte) -> piece code, for the two letter names of GameState.board ('wP', '--')
+BOARD_CODES = np.zeros(1 << 16, dtype = np.int8)
+for code, name in enumerate(PIECE_NAMES, 1):
+    BOARD_CODES[ord(name[0]) << 8 | ord(name[1])] = code
+
+# FEN piece placement -> 64 characters: the digits become that many '.'s and the '/'s are dropped
+_expand_placement = str.maketrans({**{str(n): '.' * n for n in range(1, 9)}, '/': None})
+
+
+# (N, 64) int8 piece codes from FEN strings (only the piece placement field is read)
+def encode_fens(fens):
+    placements = ''.join(fen.split(' ', 1)[0].translate(_expand_placement) for fen in fens)
+    if len(placements) != 64 * len(fens):
+        raise ValueError('a FEN in the batch does not have 64 squares')
+    return FEN_CODES[np.frombuffer(placements.encode('ascii'), dtype = np.uint8)].reshape(-1, 64)
+
+
+# (N, 64) int8 piece codes from GameStates
+def encode_game_states(game_states):
+    names = np.frombuffer(''.join(''.join(map(''.join, gs.board)) for gs in game_states).encode('ascii'),
+                          dtype = np.uint8).reshape(-1, 64, 2).astype(np.int32)
+    return BOARD_CODES[names[:, :, 0] << 8 | names[:, :, 1]]
+
+
+# (N, 64) piece codes -> (N, 12, 64) int8 one-hot planes, one plane per piece in FEN order
+def to_planes(codes):
+    return (codes[:, None, :] == np.arange(1, 13, dtype = np.int8)[None, :, None]).astype(np.int8)
+
+
+# centipawn scores (int32, white minus black) of (N, 64) piece codes
+def evaluate_codes(codes):
+    return SQUARE_VALUES[codes, np.arange(64)].sum(axis = 1, dtype = np.int32)
+
+
+# centipawn scores of (N, 12, 64) one-hot planes, as a dot product with the stacked tables
+def evaluate_planes(planes):
+    return planes.reshape(len(planes), 12 * 64).astype(np.int32) @ WEIGHTS
+
+
+def evaluate_fens(fens):
+    return evaluate_codes(encode_fens(fens))
+
+
+def evaluate_game_states(game_states):
+    return evaluate_codes(encode_game_states(game_states))
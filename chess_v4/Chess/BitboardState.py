@@ -0,0 +1,339 @@
+"""
+Alternate engine for GameState that generates moves from bitboards instead of scanning the 8x8 board.
+Select it with GameState(engine = 'bitboard'). The board list is still kept up to date, so everything that
+reads gs.board (drawing, evaluation, the move log) works the same with either engine
+"""
+from Chess.GameState import GameState, START_FEN
+from Chess import CastleRights
+from Chess.Move import Move
+
+# square index = row * 8 + col, so bit 0 is a8 and bit 63 is h1 (same orientation as GameState.board)
+SQUARES = [(sq // 8, sq % 8) for sq in range(64)]
+FULL = (1 << 64) - 1
+
+# same order as GameState.check_for_pins_and_checks: 0-3 are orthogonal, 4-7 are diagonal
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+# directions that go towards higher square indexes, where the nearest blocker is the lowest set bit
+POSITIVE = [d[0] * 8 + d[1] > 0 for d in DIRECTIONS]
+
+
+def _on_board(r, c):
+    return 0 <= r < 8 and 0 <= c < 8
+
+
+def _step_attacks(offsets):
+    table = []
+    for r, c in SQUARES:
+        mask = 0
+        for dr, dc in offsets:
+            if _on_board(r + dr, c + dc):
+                mask |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(mask)
+    return table
+
+
+KNIGHT_ATTACKS = _step_attacks(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = _step_attacks(DIRECTIONS)
+# squares attacked by a pawn of the given color standing on each square
+PAWN_ATTACKS = {'w': _step_attacks(((-1, -1), (-1, 1))), 'b': _step_attacks(((1, -1), (1, 1)))}
+
+# RAYS[d][sq]: every square from sq (exclusive) to the edge of the board in direction d
+RAYS = []
+for dr, dc in DIRECTIONS:
+    rays = []
+    for r, c in SQUARES:
+        mask = 0
+        i = 1
+        while _on_board(r + dr * i, c + dc * i):
+            mask |= 1 << ((r + dr * i) * 8 + c + dc * i)
+            i += 1
+        rays.append(mask)
+    RAYS.append(rays)
+
+# BETWEEN[a][b]: squares strictly between a and b if they share a line, else 0
+BETWEEN = [[0] * 64 for _ in range(64)]
+for a in range(64):
+    for d in range(8):
+        dr, dc = DIRECTIONS[d]
+        r, c = SQUARES[a]
+        mask = 0
+        i = 1
+        while _on_board(r + dr * i, c + dc * i):
+            b = (r + dr * i) * 8 + c + dc * i
+            BETWEEN[a][b] = mask
+            mask |= 1 << b
+            i += 1
+
+
+# the first piece hit along a ray (as a square index), given the pieces on the ray
+def _nearest(blockers, d):
+    if POSITIVE[d]:
+        return (blockers & -blockers).bit_length() - 1
+    return blockers.bit_length() - 1
+
+
+def rook_attacks(sq, occupied):
+    attacks = 0
+    for d in range(4):
+        ray = RAYS[d][sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= RAYS[d][_nearest(blockers, d)]
+        attacks |= ray
+    return attacks
+
+
+def bishop_attacks(sq, occupied):
+    attacks = 0
+    for d in range(4, 8):
+        ray = RAYS[d][sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= RAYS[d][_nearest(blockers, d)]
+        attacks |= ray
+    return attacks
+
+
+class BitboardState(GameState):
+    def __init__(self, engine = 'bitboard', fen = START_FEN):
+        super().__init__(engine, fen) # set_fen loads the bitboards
+
+    # rebuild the bitboards from self.board
+    def load_bitboards(self):
+        self.bitboards = {piece: 0 for piece in ('wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK')}
+        self.occupancy = {'w': 0, 'b': 0}
+        for sq, (r, c) in enumerate(SQUARES):
+            piece = self.board[r][c]
+            if piece != '--':
+                self.bitboards[piece] |= 1 << sq
+                self.occupancy[piece[0]] |= 1 << sq
+
+    def set_fen(self, fen):
+        super().set_fen(fen)
+        self.load_bitboards()
+
+    def make_move(self, move):
+        super().make_move(move)
+        self.toggle_move(move)
+
+    def undo_move(self):
+        if len(self.move_log) != 0:
+            move = self.move_log[-1]
+            super().undo_move()
+            self.toggle_move(move)
+
+    # xor the move into the bitboards; applying it a second time takes it back
+    def toggle_move(self, move):
+        start = 1 << (move.start_row * 8 + move.start_col)
+        end = 1 << (move.end_row * 8 + move.end_col)
+        color = move.piece_moved[0]
+        enemy_color = 'b' if color == 'w' else 'w'
+        if move.promoted_piece is None:
+            self.bitboards[move.piece_moved] ^= start | end
+        else: # the pawn leaves the start square and the promoted piece appears on the end square
+            self.bitboards[move.piece_moved] ^= start
+            self.bitboards[move.promoted_piece] ^= end
+        self.occupancy[color] ^= start | end
+        if move.is_enpassant_move:
+            captured = 1 << (move.start_row * 8 + move.end_col)
+            self.bitboards[move.piece_captured] ^= captured
+            self.occupancy[enemy_color] ^= captured
+        elif move.piece_captured != '--':
+            self.bitboards[move.piece_captured] ^= end
+            self.occupancy[enemy_color] ^= end
+        if move.is_castle_move:
+            row = move.end_row * 8
+            if move.end_col - move.start_col == 2: # kingside
+                rook = (1 << (row + 7)) | (1 << (row + 5))
+            else: # queenside
+                rook = (1 << row) | (1 << (row + 3))
+            self.bitboards[color + 'R'] ^= rook
+            self.occupancy[color] ^= rook
+
+    def has_non_pawn_material(self):
+        bb = self.bitboards
+        color = 'w' if self.white_to_move else 'b'
+        return (bb[color + 'N'] | bb[color + 'B'] | bb[color + 'R'] | bb[color + 'Q']) != 0
+
+    # bitboard of the pieces of by_color that attack sq, given the occupied squares
+    def attackers_to(self, sq, by_color, occupied):
+        bb = self.bitboards
+        defender = 'b' if by_color == 'w' else 'w'
+        attackers = (KNIGHT_ATTACKS[sq] & bb[by_color + 'N']) | (KING_ATTACKS[sq] & bb[by_color + 'K']) | \
+                    (PAWN_ATTACKS[defender][sq] & bb[by_color + 'P'])
+        queens = bb[by_color + 'Q']
+        diagonal = bb[by_color + 'B'] | queens
+        if diagonal:
+            attackers |= bishop_attacks(sq, occupied) & diagonal
+        orthogonal = bb[by_color + 'R'] | queens
+        if orthogonal:
+            attackers |= rook_attacks(sq, occupied) & orthogonal
+        return attackers
+
+    # determine if a piece of by_color attacks square (row, col)
+    def is_square_attacked(self, square, by_color):
+        return self.attackers_to(square[0] * 8 + square[1], by_color, self.occupancy['w'] | self.occupancy['b']) != 0
+
+    # all legal moves, generated directly from attack sets with pins and checks applied as masks
+    def get_valid_moves(self):
+        moves = self.generate_moves(False)
+
+        if len(moves) == 0:
+            if self.in_check:
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        else:
+            self.checkmate = False
+            self.stalemate = False
+
+        return moves
+
+    # legal captures and promotions only (for the quiescence search)
+    def get_capture_moves(self):
+        return self.generate_moves(True)
+
+    # legal moves, or only captures and promotions if captures_only, of the pieces on the from_squares bitboard (all of
+    # them by default); sets self.in_check
+    def generate_moves(self, captures_only, from_squares = FULL):
+        moves = []
+        board = self.board
+        bb = self.bitboards
+        if self.white_to_move:
+            ally_color, enemy_color, push, back_row, start_row = 'w', 'b', -8, 0, 6
+        else:
+            ally_color, enemy_color, push, back_row, start_row = 'b', 'w', 8, 7, 1
+        own = self.occupancy[ally_color]
+        enemy = self.occupancy[enemy_color]
+        occupied = own | enemy
+        king = bb[ally_color + 'K']
+        king_sq = king.bit_length() - 1
+        king_square = SQUARES[king_sq]
+
+        checkers = self.attackers_to(king_sq, enemy_color, occupied)
+        self.in_check = checkers != 0
+
+        # king moves; the king is taken off the board so it can't hide behind itself on a ray
+        targets = KING_ATTACKS[king_sq] & (enemy if captures_only else ~own) if king & from_squares else 0
+        without_king = occupied ^ king
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            to = bit.bit_length() - 1
+            if not self.attackers_to(to, enemy_color, without_king):
+                moves.append(Move(king_square, SQUARES[to], board))
+
+        if checkers & (checkers - 1) == 0: # not in double check, so other pieces can move
+            # squares a move must land on: anywhere, or on the checker / between the checker and the king
+            if checkers:
+                checker_sq = checkers.bit_length() - 1
+                check_mask = checkers | BETWEEN[king_sq][checker_sq]
+            else:
+                check_mask = FULL
+
+            # pinned pieces may only move between the king and the pinning piece (or capture it)
+            pins = {}
+            enemy_queens = bb[enemy_color + 'Q']
+            for d in range(8):
+                sliders = (bb[enemy_color + 'R'] if d < 4 else bb[enemy_color + 'B']) | enemy_queens
+                ray = RAYS[d][king_sq]
+                if not ray & sliders:
+                    continue
+                blockers = ray & occupied
+                if not blockers:
+                    continue
+                first = _nearest(blockers, d)
+                if not (own >> first) & 1:
+                    continue
+                blockers ^= 1 << first
+                if blockers:
+                    second = _nearest(blockers, d)
+                    if (sliders >> second) & 1:
+                        pins[first] = BETWEEN[king_sq][second] | (1 << second)
+
+            targets_mask = (enemy if captures_only else ~own) & check_mask
+
+            # knights (a pinned knight can never move)
+            pieces = bb[ally_color + 'N'] & from_squares
+            while pieces:
+                bit = pieces & -pieces
+                pieces ^= bit
+                sq = bit.bit_length() - 1
+                if sq in pins:
+                    continue
+                self.add_moves(sq, KNIGHT_ATTACKS[sq] & targets_mask, moves)
+
+            # sliding pieces
+            queens = bb[ally_color + 'Q']
+            for pieces, attacks in ((bb[ally_color + 'B'] | queens, bishop_attacks), (bb[ally_color + 'R'] | queens, rook_attacks)):
+                pieces &= from_squares
+                while pieces:
+                    bit = pieces & -pieces
+                    pieces ^= bit
+                    sq = bit.bit_length() - 1
+                    targets = attacks(sq, occupied) & targets_mask
+                    if sq in pins:
+                        targets &= pins[sq]
+                    self.add_moves(sq, targets, moves)
+
+            # pawns
+            pieces = bb[ally_color + 'P'] & from_squares
+            empty = ~occupied
+            enpassant_bit = 0
+            if self.enpassant_possible != ():
+                enpassant_bit = 1 << (self.enpassant_possible[0] * 8 + self.enpassant_possible[1])
+            while pieces:
+                bit = pieces & -pieces
+                pieces ^= bit
+                sq = bit.bit_length() - 1
+                allowed = check_mask & pins.get(sq, FULL)
+                start = SQUARES[sq]
+                to = sq + push
+                if (empty >> to) & 1: # one square pawn advance
+                    if (allowed >> to) & 1 and (not captures_only or to // 8 == back_row): # only promotions count as captures
+                        end = SQUARES[to]
+                        self.add_pawn_move(start, end, moves, end[0] == back_row)
+                    if not captures_only and start[0] == start_row and (empty >> (to + push)) & 1 and (allowed >> (to + push)) & 1: # two square pawn advance
+                        moves.append(Move(start, SQUARES[to + push], board))
+                targets = PAWN_ATTACKS[ally_color][sq]
+                captures = targets & enemy & allowed
+                while captures:
+                    capture = captures & -captures
+                    captures ^= capture
+                    end = SQUARES[capture.bit_length() - 1]
+                    self.add_pawn_move(start, end, moves, end[0] == back_row)
+                if targets & enpassant_bit and self.enpassant_capture_is_legal(sq, enpassant_bit, king_sq, enemy_color, occupied):
+                    moves.append(Move(start, self.enpassant_possible, board, is_enpassant_move = True))
+
+            # castling
+            if not checkers and not captures_only and king & from_squares:
+                self.get_castle_moves(king_square[0], king_square[1], moves, ally_color)
+
+        return moves
+
+    # the legal moves of the piece on (r, c)
+    def get_piece_moves(self, r, c):
+        return self.generate_moves(False, 1 << (r * 8 + c))
+
+    # add a move from sq to every square in targets
+    def add_moves(self, sq, targets, moves):
+        start = SQUARES[sq]
+        board = self.board
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            moves.append(Move(start, SQUARES[bit.bit_length() - 1], board))
+
+    # play the en passant capture on the bitboards and see if it leaves our king attacked
+    def enpassant_capture_is_legal(self, sq, enpassant_bit, king_sq, enemy_color, occupied):
+        captured = 1 << (sq // 8 * 8 + self.enpassant_possible[1])
+        self.bitboards[enemy_color + 'P'] ^= captured
+        attacked = self.attackers_to(king_sq, enemy_color, occupied ^ (1 << sq) ^ enpassant_bit ^ captured)
+        self.bitboards[enemy_color + 'P'] ^= captured
+        return attacked == 0
+
+    def get_castle_moves(self, r, c, moves, allyColor):
+        if self.castle_rights & (CastleRights.WKS if self.white_to_move else CastleRights.BKS):
+            self.get_kingside_castle_moves(r, c, moves, allyColor)
+        if self.castle_rights & (CastleRights.WQS if self.white_to_move else CastleRights.BQS):
+            self.get_queenside_castle_moves(r, c, moves, allyColor)
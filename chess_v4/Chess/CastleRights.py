@@ -1,6 +1,44 @@
-class CastleRights():
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
+"""
+Castle rights packed into a 4 bit int, one bit per right. The bit order matches the index of Zobrist.castle_keys
+"""
+WKS = 1 # white kingside
+BKS = 2 # black kingside
+WQS = 4 # white queenside
+BQS = 8 # black queenside
+ALL_RIGHTS = WKS | BKS | WQS | BQS
+
+# castle_masks[row][col] is anded into the rights when a piece moves from or to that square:
+# moving a king or rook, or capturing a rook on its starting square, loses the rights it belongs to
+castle_masks = [[ALL_RIGHTS] * 8 for _ in range(8)]
+castle_masks[7][4] = ALL_RIGHTS & ~(WKS | WQS)
+castle_masks[7][7] = ALL_RIGHTS & ~WKS
+castle_masks[7][0] = ALL_RIGHTS & ~WQS
+castle_masks[0][4] = ALL_RIGHTS & ~(BKS | BQS)
+castle_masks[0][7] = ALL_RIGHTS & ~BKS
+castle_masks[0][0] = ALL_RIGHTS & ~BQS
+
+_fen_letters = ((WKS, 'K'), (WQS, 'Q'), (BKS, 'k'), (BQS, 'q'))
+# the piece each right needs on its starting square
+_home_pieces = (((7, 4), 'wK'), ((7, 7), 'wR'), ((7, 0), 'wR'), ((0, 4), 'bK'), ((0, 7), 'bR'), ((0, 0), 'bR'))
+
+
+# the castling field of a FEN string, eg. 'KQkq' or '-'
+def from_fen(field):
+    rights = 0
+    for right, letter in _fen_letters:
+        if letter in field:
+            rights |= right
+    return rights
+
+
+# rights without the ones whose king or rook isn't on its starting square (a FEN can claim rights the board can't have)
+def on_board(rights, board):
+    for (row, col), piece in _home_pieces:
+        if board[row][col] != piece:
+            rights &= castle_masks[row][col]
+    return rights
+
+
+def to_fen(rights):
+    field = ''.join(letter for right, letter in _fen_letters if rights & right)
+    return field if field else '-'
@@ -0,0 +1,154 @@
+"""
+Static evaluation of a GameState, from white's point of view (positive is good for white).
+Material and piece-square scores come from the running totals GameState keeps; the move based features
+(checks, mobility, king zone attacks) are counted from attack maps around the enemy king instead of playing every move
+"""
+
+CHECKMATE = 1000 # white wins; black tries to minimize score
+STALEMATE = 0
+
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)) # 0-3 orthogonal, 4-7 diagonal
+KNIGHT_MOVES = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+
+
+class Evaluator:
+    # weights are in pawns per move counted for the side to move; the defaults match the original score_board
+    def __init__(self, check_weight = 0.7, mobility_weight = 0.0, king_zone_weight = 0.0, debug = False):
+        self.check_weight = check_weight # per move that gives check
+        self.mobility_weight = mobility_weight # per legal move
+        self.king_zone_weight = king_zone_weight # per move that lands next to the enemy king
+        self.debug = debug # if True, compare the check count against playing every move
+
+    # score the position; valid_moves are the legal moves of the side to move
+    def evaluate(self, gs, valid_moves):
+        if gs.checkmate:
+            if gs.white_to_move:
+                return -CHECKMATE # black wins
+            else:
+                return CHECKMATE # white wins
+        elif gs.stalemate:
+            return STALEMATE
+
+        # material and piece-square scores are kept up to date by make_move/undo_move (in centipawns)
+        score = (gs.material_score + gs.position_score) / 100
+
+        bonus = 0
+        if self.check_weight:
+            checks = self.count_checking_moves(gs, valid_moves)
+            if self.debug:
+                expected = self.count_checking_moves_by_playing(gs, valid_moves)
+                if checks != expected:
+                    raise AssertionError(f'{checks} checking moves counted from attack maps, {expected} by playing them')
+            bonus += self.check_weight * checks
+        if self.mobility_weight:
+            bonus += self.mobility_weight * len(valid_moves)
+        if self.king_zone_weight:
+            bonus += self.king_zone_weight * self.count_king_zone_moves(gs, valid_moves)
+        return score + bonus if gs.white_to_move else score - bonus
+
+    # material and piece-square scores only, a cheap estimate for where the move list isn't known (the null move test)
+    def evaluate_material(self, gs):
+        return (gs.material_score + gs.position_score) / 100
+
+    # the squares our pieces could give check from, looking outwards from the enemy king
+    def get_check_squares(self, gs):
+        board = gs.board
+        if gs.white_to_move:
+            ally_color = 'w'
+            king_row, king_col = gs.black_king_location
+            pawn_row = king_row + 1 # white pawns attack upwards
+        else:
+            ally_color = 'b'
+            king_row, king_col = gs.white_king_location
+            pawn_row = king_row - 1
+
+        knight_checks = set()
+        for m in KNIGHT_MOVES:
+            if 0 <= king_row + m[0] < 8 and 0 <= king_col + m[1] < 8:
+                knight_checks.add((king_row + m[0], king_col + m[1]))
+        pawn_checks = {(pawn_row, king_col - 1), (pawn_row, king_col + 1)}
+
+        orthogonal_checks = set()
+        diagonal_checks = set()
+        discovered = {} # square of our piece that blocks our own slider -> squares between the king and that slider
+        for j in range(len(DIRECTIONS)):
+            d = DIRECTIONS[j]
+            checks = orthogonal_checks if j < 4 else diagonal_checks
+            line = []
+            blocker = None
+            for i in range(1, 8):
+                end_row = king_row + d[0] * i
+                end_col = king_col + d[1] * i
+                if not (0 <= end_row < 8 and 0 <= end_col < 8):
+                    break
+                end_piece = board[end_row][end_col]
+                line.append((end_row, end_col))
+                if blocker is None:
+                    checks.add((end_row, end_col))
+                    if end_piece == '--':
+                        continue
+                    if end_piece[0] == ally_color: # our piece, might be uncovering one of our sliders
+                        blocker = (end_row, end_col)
+                        continue
+                    break # enemy piece
+                if end_piece == '--':
+                    continue
+                if end_piece[0] == ally_color and (end_piece[1] == 'Q' or end_piece[1] == ('R' if j < 4 else 'B')):
+                    discovered[blocker] = set(line[:-1])
+                break
+        return knight_checks, pawn_checks, orthogonal_checks, diagonal_checks, discovered
+
+    # number of valid moves that put the enemy king in check
+    def count_checking_moves(self, gs, valid_moves):
+        knight_checks, pawn_checks, orthogonal_checks, diagonal_checks, discovered = self.get_check_squares(gs)
+        count = 0
+        for move in valid_moves:
+            if move.is_castle_move or move.is_enpassant_move or move.promoted_piece is not None:
+                # these move or remove a second piece, so just play them
+                if self.gives_check_by_playing(gs, move):
+                    count += 1
+                continue
+            end = (move.end_row, move.end_col)
+            piece = move.piece_moved[1]
+            if piece == 'N':
+                gives_check = end in knight_checks
+            elif piece == 'P':
+                gives_check = end in pawn_checks
+            elif piece == 'B':
+                gives_check = end in diagonal_checks
+            elif piece == 'R':
+                gives_check = end in orthogonal_checks
+            elif piece == 'Q':
+                gives_check = end in orthogonal_checks or end in diagonal_checks
+            else: # kings can only give discovered checks
+                gives_check = False
+            if not gives_check:
+                start = (move.start_row, move.start_col)
+                if start in discovered and end not in discovered[start]: # moved off the line of one of our sliders
+                    gives_check = True
+            if gives_check:
+                count += 1
+        return count
+
+    # number of valid moves that land on a square next to the enemy king
+    def count_king_zone_moves(self, gs, valid_moves):
+        king_row, king_col = gs.black_king_location if gs.white_to_move else gs.white_king_location
+        count = 0
+        for move in valid_moves:
+            if abs(move.end_row - king_row) <= 1 and abs(move.end_col - king_col) <= 1:
+                count += 1
+        return count
+
+    def gives_check_by_playing(self, gs, move):
+        gs.make_move(move) # will switch players
+        in_check = gs.is_in_check()
+        gs.undo_move()
+        return in_check
+
+    # the original way of counting checks: play every move (used to verify count_checking_moves)
+    def count_checking_moves_by_playing(self, gs, valid_moves):
+        count = 0
+        for move in valid_moves:
+            if self.gives_check_by_playing(gs, move):
+                count += 1
+        return count
@@ -1,50 +1,105 @@
 """
 Main driver file. Responsible for handling user input and displaying the current GameState object
 """
-from Chess.CastleRights import CastleRights
+from Chess import CastleRights
 from Chess.Move import Move
+from Chess import Zobrist
+from Chess.PieceScores import piece_values, piece_square_values
+
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)) # 0-3 orthogonal, 4-7 diagonal
+KNIGHT_MOVES = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+COORDINATES = tuple(tuple((r, c) for c in range(8)) for r in range(8)) # shared (row, col) tuples so make_move doesn't build new ones
+ALL_SQUARES = (1 << 64) - 1 # block mask when not in check: a piece may move to any square
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+FEN_PIECES = 'PNBRQKpnbrqk'
+
+# the undo stack is a flat list holding one record of UNDO_RECORD_SIZE entries per move made: the en passant square,
+# castle rights, zobrist key, material score, position score and halfmove clock from before the move
+UNDO_RECORD_SIZE = 6
+UNDO_STACK_PLY = 512 # moves the undo stack has room for before it has to grow
 
 class GameState:
-    def __init__(self):
-        self.board = [
-            ['bR', 'bN', 'bB', 'bQ', 'bK', 'bB', 'bN', 'bR'],
-            ['bP', 'bP', 'bP', 'bP', 'bP', 'bP', 'bP', 'bP'],
-            ['--', '--', '--', '--', '--', '--', '--', '--'],
-            ['--', '--', '--', '--', '--', '--', '--', '--'],
-            ['--', '--', '--', '--', '--', '--', '--', '--'],
-            ['--', '--', '--', '--', '--', '--', '--', '--'],
-            ['wP', 'wP', 'wP', 'wP', 'wP', 'wP', 'wP', 'wP'],
-            ['wR', 'wN', 'wB', 'wQ', 'wK', 'wB', 'wN', 'wR'],
-        ]
+    debug_eval = False # if True, check the running material/position scores against a full recount after every move
+    count_calls = False # if True, count the calls of the legality helpers in call_counts (SearchBenchmark.py --calls)
+    call_counts = {}
+
+    # GameState(engine = 'bitboard') creates the bitboard move generator instead of the default 'mailbox' one
+    def __new__(cls, engine = 'mailbox', fen = START_FEN):
+        if cls is GameState and engine == 'bitboard':
+            from Chess.BitboardState import BitboardState # imported here since BitboardState is a subclass of GameState
+            cls = BitboardState
+        return super().__new__(cls)
+
+    # starts from the position in fen (Forsyth-Edwards Notation), the normal start position by default
+    def __init__(self, engine = 'mailbox', fen = START_FEN):
+        self.engine = engine
         self.move_functions = {'P': self.get_pawn_moves, 'R': self.get_rook_moves, 'N': self.get_knight_moves,
                               'B': self.get_bishop_moves, 'Q': self.get_queen_moves, 'K': self.get_king_moves}
-        self.white_to_move = True
-        self.move_log = []
-        self.white_king_location = (7, 4)
-        self.black_king_location = (0, 4)
-        self.checkmate = False
-        self.stalemate = False
-        self.in_check = False
-        self.pins = []
-        self.checks = []
-        self.enpassant_possible = () # ccordinates for the square where an en passant capture is possible
-        self.enpassant_possible_log = [self.enpassant_possible]
-        self.current_castling_right = CastleRights(True, True, True, True)
-        self.castle_rights_log = [CastleRights(self.current_castling_right.wks, self.current_castling_right.bks, 
-                                             self.current_castling_right.wqs, self.current_castling_right.bqs)]
+        # what undo_move needs to restore, preallocated so making and taking back moves doesn't allocate
+        self.undo_stack = [None] * (UNDO_RECORD_SIZE * UNDO_STACK_PLY)
+        self.attack_map = None # cached result of get_enemy_attack_map
+        # set_fen sets up the rest: board, white_to_move, king locations, castle_rights, enpassant_possible (coordinates
+        # of the square where an en passant capture is possible), halfmove_clock, fullmove_number, move_log, the
+        # zobrist_key hash and the running material_score/position_score (centipawns, white minus black)
+        self.set_fen(fen)
 
     
     # takes a move as a paramter and executes it
     def make_move(self, move):
+        # push the state the move is about to overwrite
+        top = self.undo_top
+        stack = self.undo_stack
+        if top == len(stack):
+            stack.extend([None] * len(stack))
+        castle_rights = self.castle_rights
+        stack[top] = self.enpassant_possible
+        stack[top + 1] = castle_rights
+        stack[top + 2] = self.zobrist_key
+        stack[top + 3] = self.material_score
+        stack[top + 4] = self.position_score
+        stack[top + 5] = self.halfmove_clock
+        self.undo_top = top + UNDO_RECORD_SIZE
+
+        key = self.zobrist_key ^ Zobrist.black_to_move_key # switch players
+        key ^= Zobrist.piece_keys[move.piece_moved][move.start_row][move.start_col]
+        piece_placed = move.piece_moved if move.promoted_piece is None else move.promoted_piece
+        key ^= Zobrist.piece_keys[piece_placed][move.end_row][move.end_col]
+        if move.is_enpassant_move:
+            key ^= Zobrist.piece_keys[move.piece_captured][move.start_row][move.end_col]
+        elif move.piece_captured != '--':
+            key ^= Zobrist.piece_keys[move.piece_captured][move.end_row][move.end_col]
+        if self.enpassant_possible != ():
+            key ^= Zobrist.enpassant_key(self)
+        key ^= Zobrist.castle_keys[castle_rights]
+
+        material = self.material_score
+        position = self.position_score - piece_square_values[move.piece_moved][move.start_row][move.start_col] \
+                   + piece_square_values[piece_placed][move.end_row][move.end_col]
+        if move.promoted_piece is not None:
+            material += piece_values[piece_placed] - piece_values[move.piece_moved]
+        if move.is_enpassant_move:
+            material -= piece_values[move.piece_captured]
+            position -= piece_square_values[move.piece_captured][move.start_row][move.end_col]
+        elif move.piece_captured != '--':
+            material -= piece_values[move.piece_captured]
+            position -= piece_square_values[move.piece_captured][move.end_row][move.end_col]
+
         self.board[move.start_row][move.start_col] = '--'
-        self.board[move.end_row][move.end_col] = move.piece_moved
+        self.board[move.end_row][move.end_col] = piece_placed # the pawn is replaced on promotion
         self.move_log.append(move) # log the move
+        if move.piece_moved[1] == 'P' or move.piece_captured != '--':
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if not self.white_to_move:
+            self.fullmove_number += 1
         self.white_to_move = not self.white_to_move # switch players
         # update the king's location
         if move.piece_moved == 'wK':
-            self.white_king_location = (move.end_row, move.end_col)
+            self.white_king_location = COORDINATES[move.end_row][move.end_col]
         elif move.piece_moved == 'bK':
-            self.black_king_location = (move.end_row, move.end_col)
+            self.black_king_location = COORDINATES[move.end_row][move.end_col]
         
 
         # en passant
@@ -53,26 +108,99 @@ class GameState:
         
         # update enpassantPossible variable
         if move.piece_moved[1] == 'P' and abs(move.start_row - move.end_row) == 2: # only on 2 square pawn advances
-            self.enpassant_possible = ((move.start_row + move.end_row) // 2, move.start_col)
+            self.enpassant_possible = COORDINATES[(move.start_row + move.end_row) // 2][move.start_col]
         else:
             self.enpassant_possible = ()
 
         # castle move
         if move.is_castle_move:
             if move.end_col - move.start_col == 2: # kingside castle
-                self.board[move.end_row][move.end_col - 1] = self.board[move.end_row][move.end_col + 1] # removes the rook
+                rook = self.board[move.end_row][move.end_col + 1]
+                self.board[move.end_row][move.end_col - 1] = rook # removes the rook
                 self.board[move.end_row][move.end_col + 1] = '--' # erase the old rook
+                key ^= Zobrist.piece_keys[rook][move.end_row][move.end_col + 1] ^ Zobrist.piece_keys[rook][move.end_row][move.end_col - 1]
+                position += piece_square_values[rook][move.end_row][move.end_col - 1] - piece_square_values[rook][move.end_row][move.end_col + 1]
             else: # queenside castle
-                self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][move.end_col - 2] # removes the rook
+                rook = self.board[move.end_row][move.end_col - 2]
+                self.board[move.end_row][move.end_col + 1] = rook # removes the rook
                 self.board[move.end_row][move.end_col - 2] = '--' # erase the old rook
+                key ^= Zobrist.piece_keys[rook][move.end_row][move.end_col - 2] ^ Zobrist.piece_keys[rook][move.end_row][move.end_col + 1]
+                position += piece_square_values[rook][move.end_row][move.end_col + 1] - piece_square_values[rook][move.end_row][move.end_col - 2]
+
+        # update castle rights: moving the king or a rook or capturing a rook loses the rights that go with it
+        castle_rights &= CastleRights.castle_masks[move.start_row][move.start_col] & CastleRights.castle_masks[move.end_row][move.end_col]
+        self.castle_rights = castle_rights
+
+        # hash in the new en passant square and castle rights
+        if self.enpassant_possible != ():
+            key ^= Zobrist.enpassant_key(self)
+        key ^= Zobrist.castle_keys[castle_rights]
+        self.zobrist_key = key
+        self.material_score = material
+        self.position_score = position
+        if self.debug_eval:
+            self.check_eval()
+
+    # pass the turn without moving, for null move pruning in the search: the other side moves next and there is no en
+    # passant capture. Not logged in move_log; take it back with undo_null_move
+    def make_null_move(self):
+        top = self.undo_top
+        stack = self.undo_stack
+        if top == len(stack):
+            stack.extend([None] * len(stack))
+        stack[top] = self.enpassant_possible
+        stack[top + 1] = self.castle_rights
+        stack[top + 2] = self.zobrist_key
+        stack[top + 3] = self.material_score
+        stack[top + 4] = self.position_score
+        stack[top + 5] = self.halfmove_clock
+        self.undo_top = top + UNDO_RECORD_SIZE
+        key = self.zobrist_key ^ Zobrist.black_to_move_key
+        if self.enpassant_possible != ():
+            key ^= Zobrist.enpassant_key(self)
+            self.enpassant_possible = ()
+        self.zobrist_key = key
+        self.halfmove_clock += 1
+        self.white_to_move = not self.white_to_move
+
+    def undo_null_move(self):
+        top = self.undo_top - UNDO_RECORD_SIZE
+        stack = self.undo_stack
+        self.enpassant_possible = stack[top]
+        self.zobrist_key = stack[top + 2]
+        self.halfmove_clock = stack[top + 5]
+        self.undo_top = top
+        self.white_to_move = not self.white_to_move
+        self.checkmate = False
+        self.stalemate = False
 
-        self.enpassant_possible_log.append(self.enpassant_possible)
+    # does the side to move have a piece other than its king and pawns (positions without one are where zugzwang,
+    # having to move, is a disadvantage)
+    def has_non_pawn_material(self):
+        ally_color = 'w' if self.white_to_move else 'b'
+        for row in self.board:
+            for piece in row:
+                if piece[0] == ally_color and piece[1] in 'NBRQ':
+                    return True
+        return False
 
-        # update castle rights
-        self.update_castle_rights(move)
-        self.castle_rights_log.append(CastleRights(self.current_castling_right.wks, self.current_castling_right.bks, 
-                                             self.current_castling_right.wqs, self.current_castling_right.bqs))
-        
+    # full recount of the material and piece-square scores in centipawns (white minus black)
+    def count_eval(self):
+        material = 0
+        position = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != '--':
+                    material += piece_values[piece]
+                    position += piece_square_values[piece][r][c]
+        return material, position
+
+    # make sure the running scores match a full recount (debug_eval)
+    def check_eval(self):
+        expected = self.count_eval()
+        if (self.material_score, self.position_score) != expected:
+            raise AssertionError(f'running eval {(self.material_score, self.position_score)} != recount {expected} after {len(self.move_log)} moves')
 
     def check_pawn_promotion(self, move):
         if move.piece_moved == 'wP':
@@ -84,33 +212,189 @@ class GameState:
         
         return False
     
+    # set up the position given in Forsyth-Edwards Notation, eg. 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+    # (the move counters can be left out, as in EPD). Raises ValueError if the position can't be read
+    def set_fen(self, fen):
+        fields = fen.split()
+        if not fields:
+            raise ValueError('empty FEN')
+        board = []
+        for rank in fields[0].split('/'):
+            row = []
+            for char in rank:
+                if char.isdigit(): # run of empty squares
+                    row.extend(['--'] * int(char))
+                elif char in FEN_PIECES: # uppercase is white, lowercase is black
+                    row.append(('w' if char.isupper() else 'b') + char.upper())
+                else:
+                    raise ValueError(f'unexpected {char!r} in FEN {fen!r}')
+            if len(row) != 8:
+                raise ValueError(f'rank {rank!r} of FEN {fen!r} is not 8 squares')
+            board.append(row)
+        if len(board) != 8:
+            raise ValueError(f'FEN {fen!r} does not have 8 ranks')
+        self.board = board
+        self.white_king_location = self.black_king_location = None
+        for r in range(8):
+            for c in range(8):
+                if board[r][c] == 'wK':
+                    self.white_king_location = COORDINATES[r][c]
+                elif board[r][c] == 'bK':
+                    self.black_king_location = COORDINATES[r][c]
+        if self.white_king_location is None or self.black_king_location is None:
+            raise ValueError(f'FEN {fen!r} needs a king for each side')
+
+        side = fields[1] if len(fields) > 1 else 'w'
+        if side not in ('w', 'b'):
+            raise ValueError(f'bad side to move {side!r} in FEN {fen!r}')
+        self.white_to_move = side == 'w'
+        castling = fields[2] if len(fields) > 2 else '-'
+        self.castle_rights = CastleRights.on_board(CastleRights.from_fen(castling), board)
+        enpassant = fields[3] if len(fields) > 3 else '-'
+        if enpassant == '-':
+            self.enpassant_possible = ()
+        elif len(enpassant) == 2 and enpassant[0] in Move.files_to_cols and enpassant[1] == ('6' if self.white_to_move else '3'):
+            # the square a pawn of the side that just moved skipped over
+            self.enpassant_possible = COORDINATES[Move.ranks_to_rows[enpassant[1]]][Move.files_to_cols[enpassant[0]]]
+        else:
+            raise ValueError(f'bad en passant square {enpassant!r} in FEN {fen!r}')
+        self.halfmove_clock = int(fields[4]) if len(fields) > 4 and fields[4].isdigit() else 0
+        self.fullmove_number = int(fields[5]) if len(fields) > 5 and fields[5].isdigit() else 1
+
+        self.move_log = []
+        self.undo_top = 0
+        self.checkmate = False
+        self.stalemate = False
+        self.in_check = False
+        self.pins = []
+        self.checks = []
+        self.pin_directions = [None] * 64 # see update_legality_masks
+        self.block_mask = ALL_SQUARES
+        self.zobrist_key = Zobrist.hash_position(self) # 64 bit hash of the position, updated incrementally
+        self.material_score, self.position_score = self.count_eval()
+        self.attack_map_key = None # zobrist key of the position the attack map was made for
+        self.pins_checks_key = None # zobrist key of the position in_check, pins, checks and the masks were found for
+
+    # the current position in Forsyth-Edwards Notation
+    def to_fen(self):
+        ranks = []
+        for row in self.board:
+            rank = ''
+            empty = 0
+            for piece in row:
+                if piece == '--':
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1] if piece[0] == 'w' else piece[1].lower()
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        if self.enpassant_possible == ():
+            enpassant = '-'
+        else:
+            enpassant = Move.cols_to_files[self.enpassant_possible[1]] + Move.rows_to_ranks[self.enpassant_possible[0]]
+        return f"{'/'.join(ranks)} {'w' if self.white_to_move else 'b'} {CastleRights.to_fen(self.castle_rights)} " \
+               f"{enpassant} {self.halfmove_clock} {self.fullmove_number}"
+
+    # create a GameState from a FEN string
+    @classmethod
+    def from_fen(cls, fen, engine = 'mailbox'):
+        return cls(engine, fen)
+
+    # count the positions at the given depth of the move tree (used to test and benchmark the move generator)
+    def perft(self, depth):
+        if depth == 0:
+            return 1
+        moves = self.get_valid_moves()
+        if depth == 1: # no need to play the last moves, just count them
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            self.make_move(move)
+            nodes += self.perft(depth - 1)
+            self.undo_move()
+        return nodes
+
+    # perft split up by the first move, to narrow down which move a wrong count comes from
+    def divide(self, depth):
+        counts = {}
+        for move in self.get_valid_moves():
+            self.make_move(move)
+            counts[move.get_chess_notation()] = self.perft(depth - 1)
+            self.undo_move()
+        return counts
+
+    # standard algebraic notation of a legal move in this position, as used in PGN files, eg. 'Nbd7', 'exd5', 'e8=Q+'
+    def get_san(self, move):
+        in_check, checkmate, stalemate = self.in_check, self.checkmate, self.stalemate
+        if move.is_castle_move:
+            san = 'O-O' if move.end_col > move.start_col else 'O-O-O'
+        else:
+            end_square = move.get_rank_file(move.end_row, move.end_col)
+            piece = move.piece_moved[1]
+            if piece == 'P':
+                san = (Move.cols_to_files[move.start_col] + 'x' + end_square) if move.is_capture else end_square
+                if move.promoted_piece is not None:
+                    san += '=' + move.promoted_piece[1]
+            else:
+                # name the start file, rank or square if another piece of the same type can move to the same square
+                others = [other for other in self.get_valid_moves() if other.piece_moved == move.piece_moved and other != move
+                          and other.end_row == move.end_row and other.end_col == move.end_col]
+                disambiguation = ''
+                if others:
+                    if all(other.start_col != move.start_col for other in others):
+                        disambiguation = Move.cols_to_files[move.start_col]
+                    elif all(other.start_row != move.start_row for other in others):
+                        disambiguation = Move.rows_to_ranks[move.start_row]
+                    else:
+                        disambiguation = move.get_rank_file(move.start_row, move.start_col)
+                san = piece + disambiguation + ('x' if move.is_capture else '') + end_square
+        self.make_move(move)
+        self.get_valid_moves() # sets checkmate and in_check for the position after the move
+        if self.checkmate:
+            san += '#'
+        elif self.in_check:
+            san += '+'
+        self.undo_move()
+        self.in_check, self.checkmate, self.stalemate = in_check, checkmate, stalemate
+        self.pins_checks_key = None # in_check is this position's again, but the pins and checks are still the other's
+        return san
+
     # undo the last move
     def undo_move(self):
-        if len(self.move_log) != 0:
-            move = self.move_log.pop()
-            self.white_to_move = not self.white_to_move
-            self.board[move.end_row][move.end_col] = move.piece_captured
-            self.board[move.start_row][move.start_col] = move.piece_moved
-            
-            
+        if len(self.move_log) == 0:
+            return
+        move = self.move_log.pop()
+        self.white_to_move = not self.white_to_move
+        if not self.white_to_move:
+            self.fullmove_number -= 1
+        self.board[move.end_row][move.end_col] = move.piece_captured
+        self.board[move.start_row][move.start_col] = move.piece_moved
+
         # update the king's location
         if move.piece_moved == 'wK':
-            self.white_king_location = (move.start_row, move.start_col)
+            self.white_king_location = COORDINATES[move.start_row][move.start_col]
         elif move.piece_moved == 'bK':
-            self.black_king_location = (move.start_row, move.start_col)
+            self.black_king_location = COORDINATES[move.start_row][move.start_col]
         
         # undo en passant
         if move.is_enpassant_move:
             self.board[move.end_row][move.end_col] = '--' # leave landing square blank
             self.board[move.start_row][move.end_col] = move.piece_captured
 
-        self.enpassant_possible_log.pop()
-        self.enpassant_possible = self.enpassant_possible_log[-1]
-        
-
-        # undo castling rights
-        self.castle_rights_log.pop() # get rid of new castle rights from the move we are undoing
-        self.current_castling_right = self.castle_rights_log[-1] # set the current castle rights to the last one in the list
+        # restore the en passant square, castle rights, hash, eval and halfmove clock from the undo stack
+        top = self.undo_top - UNDO_RECORD_SIZE
+        stack = self.undo_stack
+        self.enpassant_possible = stack[top]
+        self.castle_rights = stack[top + 1]
+        self.zobrist_key = stack[top + 2]
+        self.material_score = stack[top + 3]
+        self.position_score = stack[top + 4]
+        self.halfmove_clock = stack[top + 5]
+        self.undo_top = top
 
         # undo castle move
         if move.is_castle_move:
@@ -124,58 +408,28 @@ class GameState:
         # undo checkmate/stalemate
         self.checkmate = False
         self.stalemate = False
+        if self.debug_eval:
+            self.check_eval()
 
         
 
     # all moves considering checks
     def get_valid_moves(self):
-        moves = []
-        self.in_check, self.pins, self.checks = self.check_for_pins_and_checks() # check for pins and checks
+        if self.count_calls:
+            self.count_call('get_valid_moves')
+        self.update_pins_and_checks()
         if self.white_to_move:
-            king_row, king_col = self.white_king_location[0], self.white_king_location[1]
-            self.get_castle_moves(king_row, king_col, moves, 'w')
+            king_row, king_col, ally_color = self.white_king_location[0], self.white_king_location[1], 'w'
         else:
-            king_row, king_col = self.black_king_location[0], self.black_king_location[1]
-            self.get_castle_moves(king_row, king_col, moves, 'b')
-
-
-
-        if self.in_check:
-            if len(self.checks) == 1: # only one check, can block or move king
-                moves = self.get_all_moves()
-                # to block a check you must move a piece into one of the squares between the enemy piece and king
-                check = self.checks[0] # check information
-                check_row = check[0]
-                check_col = check[1]
-                piece_checking = self.board[check_row][check_col] # enemy pice causing the check
-                valid_squares = [] # squares that pieces can move to
-                # if knight, we cannot block and must capture it or move the king
-                if piece_checking[1] == 'N':
-                    valid_squares = [(check_row, check_col)]
-                else: # not a knight; blocking logic
-                    for i in range(1, 8):
-                        valid_square = (king_row + check[2] * i, king_col + check[3] * i) # check[2] and check[3] are the check directions
-                        valid_squares.append(valid_square) # can move to any piece between the king and the attacker or move to the attacker's square itself
-                        if valid_square[0] == check_row and valid_square[1] == check_col: # once you get to the attacker, there are no more valid squares after
-                            break
-                
-                # get rid of any moves that don't block check or move king
-                for i in range (len(moves) -1, -1, -1): # go through the list backwards when removing 
-                    if moves[i].piece_moved[1] != 'K': # if the move doesn't move the king (must block or capture)
-                        if not (moves[i].end_row, moves[i].end_col) in valid_squares: # move doesn't block check or capture piece
-                            moves.remove(moves[i])
-
-            else: # double check, king must move
-                self.get_king_moves(king_row, king_col, moves)
+            king_row, king_col, ally_color = self.black_king_location[0], self.black_king_location[1], 'b'
 
-        else: # not in check so all moves are fine
+        if len(self.checks) > 1: # double check, king must move
+            moves = []
+            self.get_king_moves(king_row, king_col, moves)
+        else: # the generators only make the moves the pins and a check allow, so nothing has to be taken out after
             moves = self.get_all_moves()
-        
-
-        if self.white_to_move:
-            self.get_castle_moves(king_row, king_col, moves, 'w')
-        else:
-            self.get_castle_moves(king_row, king_col, moves, 'b')
+            if not self.in_check: # can't castle out of check
+                self.get_castle_moves(king_row, king_col, moves, ally_color)
 
         if len(moves) == 0:
             if self.in_check:
@@ -189,28 +443,218 @@ class GameState:
 
         return moves
 
-    # all moves not considering checks
+    # legal captures and promotions only (for the quiescence search)
+    def get_capture_moves(self):
+        self.update_pins_and_checks()
+        if self.in_check: # evasions have to block or capture, generate them all
+            moves = self.get_valid_moves()
+            return [move for move in moves if move.is_capture or move.promoted_piece is not None]
+
+        if self.white_to_move:
+            ally_color, enemy_color, move_amount, back_row = 'w', 'b', -1, 0
+        else:
+            ally_color, enemy_color, move_amount, back_row = 'b', 'w', 1, 7
+        pin_directions = self.pin_directions
+        moves = []
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece[0] != ally_color:
+                    continue
+                pin_direction = pin_directions[r * 8 + c]
+                if piece[1] == 'P':
+                    end_row = r + move_amount
+                    if end_row == back_row and self.board[end_row][c] == '--': # promotion by pushing
+                        if pin_direction is None or pin_direction[1] == 0:
+                            self.add_pawn_move((r, c), (end_row, c), moves, True)
+                    for dc in (-1, 1):
+                        end_col = c + dc
+                        if 0 <= end_col < 8 and self.board[end_row][end_col][0] == enemy_color:
+                            if pin_direction is None or pin_direction == (move_amount, dc):
+                                self.add_pawn_move((r, c), (end_row, end_col), moves, end_row == back_row)
+                    if self.enpassant_possible != () and self.enpassant_possible[0] == end_row and abs(self.enpassant_possible[1] - c) == 1:
+                        # en passant has its own pin rules, so let the pawn generator decide
+                        pawn_moves = []
+                        self.get_pawn_moves(r, c, pawn_moves)
+                        moves.extend(move for move in pawn_moves if move.is_enpassant_move)
+                elif piece[1] == 'N':
+                    if pin_direction is None: # a pinned knight can never move
+                        for m in KNIGHT_MOVES:
+                            end_row, end_col = r + m[0], c + m[1]
+                            if 0 <= end_row < 8 and 0 <= end_col < 8 and self.board[end_row][end_col][0] == enemy_color:
+                                moves.append(Move((r, c), (end_row, end_col), self.board))
+                elif piece[1] == 'K':
+                    attacked = self.get_enemy_attack_map()
+                    for d in DIRECTIONS:
+                        end_row, end_col = r + d[0], c + d[1]
+                        if 0 <= end_row < 8 and 0 <= end_col < 8 and self.board[end_row][end_col][0] == enemy_color:
+                            if not attacked[end_row][end_col]:
+                                moves.append(Move((r, c), (end_row, end_col), self.board))
+                else: # sliding pieces capture the first piece in each direction if it is an enemy
+                    directions = DIRECTIONS[:4] if piece[1] == 'R' else DIRECTIONS[4:] if piece[1] == 'B' else DIRECTIONS
+                    for d in directions:
+                        if pin_direction is not None and pin_direction != d and pin_direction != (-d[0], -d[1]):
+                            continue
+                        for i in range(1, 8):
+                            end_row, end_col = r + d[0] * i, c + d[1] * i
+                            if not (0 <= end_row < 8 and 0 <= end_col < 8):
+                                break
+                            end_piece = self.board[end_row][end_col]
+                            if end_piece != '--':
+                                if end_piece[0] == enemy_color:
+                                    moves.append(Move((r, c), (end_row, end_col), self.board))
+                                break
+        return moves
+
+    # the moves of every piece but the king's castling; the generators leave out moves the pins and checks don't allow
     def get_all_moves(self):
         moves = []
-        for r in range(len(self.board)): # number of rows
-            for c in range(len(self.board[r])): # number of columns in a given row
-                turn = self.board[r][c][0]
-                if (turn == 'w' and self.white_to_move) or (turn == 'b' and not self.white_to_move):
-                    piece = self.board[r][c][1]
-                    self.move_functions[piece](r, c, moves) # calls the appropriate move function based on piece type
+        ally_color = 'w' if self.white_to_move else 'b'
+        move_functions = self.move_functions
+        for r, row in enumerate(self.board):
+            for c, piece in enumerate(row):
+                if piece[0] == ally_color:
+                    move_functions[piece[1]](r, c, moves) # calls the appropriate move function based on piece type
+        return moves
+
+    # the legal moves of the piece on (r, c), castling included for the king; lets the search check that a move
+    # remembered from another position (a hash or killer move) can be played here without generating every move
+    def get_piece_moves(self, r, c):
+        piece = self.board[r][c]
+        if piece[0] != ('w' if self.white_to_move else 'b'):
+            return []
+        self.update_pins_and_checks()
+        moves = []
+        self.move_functions[piece[1]](r, c, moves)
+        if piece[1] == 'K' and not self.in_check:
+            self.get_castle_moves(r, c, moves, piece[0])
         return moves
 
     # determine if the enemy can attack the square r, c
     def square_under_attack(self, r, c):
-        self.white_to_move = not self.white_to_move # switch to opponent's turn
-        opp_moves = self.get_all_moves()
-        self.white_to_move = not self.white_to_move # switch turns back
-        for move in opp_moves:
-            if move.end_row == r and move.end_col == c: # square is under attack
+        return self.is_square_attacked((r, c), 'b' if self.white_to_move else 'w')
+
+    # determine if a piece of by_color attacks square (row, col), looking outwards from the square for each kind of attacker
+    def is_square_attacked(self, square, by_color):
+        if self.count_calls:
+            self.count_call('is_square_attacked')
+        r, c = square
+        board = self.board
+        pawn_row = r + 1 if by_color == 'w' else r - 1 # white pawns attack from the row below
+        if 0 <= pawn_row < 8:
+            if (c > 0 and board[pawn_row][c - 1] == by_color + 'P') or (c < 7 and board[pawn_row][c + 1] == by_color + 'P'):
+                return True
+        for m in KNIGHT_MOVES:
+            end_row, end_col = r + m[0], c + m[1]
+            if 0 <= end_row < 8 and 0 <= end_col < 8 and board[end_row][end_col] == by_color + 'N':
                 return True
+        for j in range(len(DIRECTIONS)):
+            d = DIRECTIONS[j]
+            slider = 'R' if j < 4 else 'B'
+            for i in range(1, 8):
+                end_row, end_col = r + d[0] * i, c + d[1] * i
+                if not (0 <= end_row < 8 and 0 <= end_col < 8):
+                    break
+                end_piece = board[end_row][end_col]
+                if end_piece != '--':
+                    if end_piece[0] == by_color and (end_piece[1] == 'Q' or end_piece[1] == slider or (i == 1 and end_piece[1] == 'K')):
+                        return True
+                    break
         return False
 
+    # is the side to move in check
+    def is_in_check(self):
+        if self.white_to_move:
+            return self.is_square_attacked(self.white_king_location, 'b')
+        return self.is_square_attacked(self.black_king_location, 'w')
+
+    # 8x8 grid of the squares the opponent of the side to move attacks. Our king is taken off the board, so squares
+    # behind it on a checking line count as attacked and the map tells where the king can go. Cached for the position
+    def get_enemy_attack_map(self):
+        if self.attack_map_key == self.zobrist_key:
+            return self.attack_map
+        if self.count_calls:
+            self.count_call('get_enemy_attack_map')
+        board = self.board
+        if self.white_to_move:
+            enemy_color, pawn_direction = 'b', 1
+            king_row, king_col = self.white_king_location
+        else:
+            enemy_color, pawn_direction = 'w', -1
+            king_row, king_col = self.black_king_location
+        attacked = [[False] * 8 for _ in range(8)]
+        for r in range(8):
+            for c in range(8):
+                piece = board[r][c]
+                if piece[0] != enemy_color:
+                    continue
+                if piece[1] == 'P':
+                    if 0 <= r + pawn_direction < 8:
+                        if c > 0:
+                            attacked[r + pawn_direction][c - 1] = True
+                        if c < 7:
+                            attacked[r + pawn_direction][c + 1] = True
+                elif piece[1] == 'N' or piece[1] == 'K':
+                    for m in (KNIGHT_MOVES if piece[1] == 'N' else DIRECTIONS):
+                        if 0 <= r + m[0] < 8 and 0 <= c + m[1] < 8:
+                            attacked[r + m[0]][c + m[1]] = True
+                else:
+                    directions = DIRECTIONS[:4] if piece[1] == 'R' else DIRECTIONS[4:] if piece[1] == 'B' else DIRECTIONS
+                    for d in directions:
+                        for i in range(1, 8):
+                            end_row, end_col = r + d[0] * i, c + d[1] * i
+                            if not (0 <= end_row < 8 and 0 <= end_col < 8):
+                                break
+                            attacked[end_row][end_col] = True
+                            if board[end_row][end_col] != '--' and (end_row != king_row or end_col != king_col):
+                                break
+        self.attack_map = attacked
+        self.attack_map_key = self.zobrist_key
+        return attacked
+
+    # turn the pins and checks found by check_for_pins_and_checks into what the move generators look up:
+    # pin_directions[row * 8 + col] is the direction the allied piece on that square is pinned along (None if it isn't
+    # pinned), block_mask has a bit (row * 8 + col) for every square a piece other than the king may move to: all of
+    # them when not in check, the checking piece and the squares between it and the king in check, none in double check
+    def update_legality_masks(self):
+        pin_directions = [None] * 64
+        for pin in self.pins:
+            pin_directions[pin[0] * 8 + pin[1]] = (pin[2], pin[3])
+        self.pin_directions = pin_directions
+        if not self.checks:
+            self.block_mask = ALL_SQUARES
+        elif len(self.checks) > 1:
+            self.block_mask = 0
+        else:
+            check_row, check_col, row_step, col_step = self.checks[0]
+            if self.board[check_row][check_col][1] == 'N': # can't block a knight, only capture it
+                self.block_mask = 1 << (check_row * 8 + check_col)
+            else:
+                king_row, king_col = self.white_king_location if self.white_to_move else self.black_king_location
+                block_mask = 0
+                for i in range(1, 8):
+                    r, c = king_row + row_step * i, king_col + col_step * i
+                    block_mask |= 1 << (r * 8 + c)
+                    if r == check_row and c == check_col:
+                        break
+                self.block_mask = block_mask
+
+    # in_check, pins, checks and the legality masks for the position, found once per position: get_valid_moves and
+    # get_capture_moves are often both asked about the same one (the quiescence search at a leaf of the main search)
+    def update_pins_and_checks(self):
+        if self.pins_checks_key == self.zobrist_key:
+            return
+        self.in_check, self.pins, self.checks = self.check_for_pins_and_checks()
+        self.update_legality_masks()
+        self.pins_checks_key = self.zobrist_key
+
+    # count_calls bookkeeping: call_counts[name] += 1
+    def count_call(self, name):
+        self.call_counts[name] = self.call_counts.get(name, 0) + 1
+
     def check_for_pins_and_checks(self):
+        if self.count_calls:
+            self.count_call('check_for_pins_and_checks')
         pins = [] # squares where the allied pin piece is and direction pinned from
         checks = [] # squares where enemy is applying a check
         in_check = False
@@ -278,17 +722,11 @@ class GameState:
 
         return in_check, pins, checks
    
-   # get all the pawn moves for the pawn located at row, col and add these moves to the list
+    # get all the pawn moves for the pawn located at row, col and add these moves to the list
     def get_pawn_moves(self, r, c, moves):
-        piece_pinned = False
-        pin_direction = ()
-        for i in range (len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
-
+        pin_direction = self.pin_directions[r * 8 + c]
+        block_mask = self.block_mask
+        board = self.board
         if self.white_to_move:
             move_amount, start_row, back_row, enemy_color = -1, 6, 0, 'b'
             king_row, king_col = self.white_king_location
@@ -296,245 +734,134 @@ class GameState:
             move_amount, start_row, back_row, enemy_color = 1, 1, 7, 'w'
             king_row, king_col = self.black_king_location
 
-        pawn_promotion = False
-
-        if self.board[r + move_amount][c] == '--': # one square pawn advance
-            if not piece_pinned or pin_direction == (move_amount, 0):
-                if r+move_amount == back_row: # if piece gets to back rank then it is pawn promotion  
-                    pawn_promotion = True
-                moves.append(Move((r,c), (r+move_amount, c), self.board, pawn_promotion = pawn_promotion))
-                if r == start_row and self.board[r+2*move_amount][c] == '--': # two square pawn advance
-                    moves.append(Move((r,c), (r+2*move_amount, c), self.board))
-        if c-1 >= 0: # capture to left
-            if not piece_pinned or pin_direction == (move_amount, -1):
-                if self.board[r + move_amount][c-1][0] == enemy_color:
-                    if r + move_amount == back_row: # if piece gets to the back rank then it is a pawn promotion
-                        pawn_promotion = True
-                    moves.append(Move((r,c), (r+move_amount, c-1), self.board, pawn_promotion = pawn_promotion))
-                if (r+move_amount, c-1) == self.enpassant_possible:
-                    attacking_piece = blocking_piece = False
-                    if king_row == r:
-                        if king_col < c: # king is left of the pawn
-                            # inside range between king and pawn; outside range between pawn border
-                            inside_range = range(king_col +1 , c - 1)
-                            outside_range = range(c+1, 8)
-                        else: # king right of the pawn
-                            inside_range = range(king_col - 1, c, - 1)
-                            outside_range = range(c - 2, -1, -1)
-                        for i in inside_range:
-                            if self.board[r][i] != '--': # some other piece beside enpassant pawn blocks
-                                blocking_piece = True
-                        for i in outside_range:
-                            square = self.board[r][i]
-                            if square[0] == enemy_color and (square[1] == 'R' or square[1] =='Q'): # attacking piece
-                                attacking_piece = True
-                            elif square != '--':
-                                blocking_piece = True
-                    
-                    if not attacking_piece or blocking_piece:
-                        moves.append(Move((r,c), (r+move_amount, c-1), self.board, is_enpassant_move = True))
-        
-        if c+1 <= 7: # capture to right
-            if not piece_pinned or pin_direction == (move_amount, 1):
-                if self.board[r + move_amount][c+1][0] == enemy_color:
-                    if r + move_amount == back_row: # if piece gets to the back rank then it is a pawn promotion
-                        pawn_promotion = True
-                    moves.append(Move((r,c), (r+move_amount, c+1), self.board, pawn_promotion = pawn_promotion))
-                if (r+move_amount, c+1) == self.enpassant_possible:
-                    attacking_piece = blocking_piece = False
-                    if king_row == r:
-                        if king_col < c: # king is left of the pawn
-                            # inside range between king and pawn; outside range between pawn border
-                            inside_range = range(king_col + 1 , c)
-                            outside_range = range(c+2, 8)
-                        else: # king right of the pawn
-                            inside_range = range(king_col - 1, c + 1, - 1)
-                            outside_range = range(c - 1, -1, -1)
-                        for i in inside_range:
-                            if self.board[r][i] != '--': # some other piece beside enpassant pawn blocks
-                                blocking_piece = True
-                        for i in outside_range:
-                            square = self.board[r][i]
-                            if square[0] == enemy_color and (square[1] == 'R' or square[1] =='Q'): # attacking piece
-                                attacking_piece = True
-                            elif square != '--':
-                                blocking_piece = True
-                    
-                    if not attacking_piece or blocking_piece:
-                        moves.append(Move((r,c), (r+move_amount, c+1), self.board, is_enpassant_move = True))
+        end_row = r + move_amount
+        if board[end_row][c] == '--': # one square pawn advance
+            if pin_direction is None or pin_direction[1] == 0: # pinned along the file, either way, it stays on the line
+                if block_mask >> (end_row * 8 + c) & 1:
+                    self.add_pawn_move((r, c), (end_row, c), moves, end_row == back_row)
+                two_row = end_row + move_amount
+                if r == start_row and board[two_row][c] == '--' and block_mask >> (two_row * 8 + c) & 1: # two square pawn advance
+                    moves.append(Move((r, c), (two_row, c), board))
+        for col_step in (-1, 1): # captures to the left and right
+            end_col = c + col_step
+            if not 0 <= end_col < 8 or (pin_direction is not None and pin_direction != (move_amount, col_step)):
+                continue
+            if board[end_row][end_col][0] == enemy_color and block_mask >> (end_row * 8 + end_col) & 1:
+                self.add_pawn_move((r, c), (end_row, end_col), moves, end_row == back_row)
+            if (end_row, end_col) == self.enpassant_possible:
+                # in check, en passant can block by landing on the square or capture the checking pawn beside us
+                if block_mask >> (end_row * 8 + end_col) & 1 or block_mask >> (r * 8 + end_col) & 1:
+                    if not self.enpassant_uncovers_check(r, c, end_col, king_row, king_col, enemy_color):
+                        moves.append(Move((r, c), (end_row, end_col), board, is_enpassant_move = True))
+
+    # en passant takes two pawns off the row of the capturing pawn at once, which can uncover a rook or queen on that
+    # row that neither pawn is pinned by on its own
+    def enpassant_uncovers_check(self, r, c, captured_col, king_row, king_col, enemy_color):
+        if king_row != r:
+            return False
+        col_step = 1 if c > king_col else -1
+        col = king_col + col_step
+        while 0 <= col < 8:
+            if col != c and col != captured_col:
+                square = self.board[r][col]
+                if square != '--':
+                    return square[0] == enemy_color and (square[1] == 'R' or square[1] == 'Q')
+            col += col_step
+        return False
+
+    # add a pawn move to the list, or one move for each piece the pawn can promote to
+    def add_pawn_move(self, start_sq, end_sq, moves, pawn_promotion):
+        if pawn_promotion:
+            color = self.board[start_sq[0]][start_sq[1]][0]
+            for piece in ('Q', 'R', 'B', 'N'):
+                moves.append(Move(start_sq, end_sq, self.board, pawn_promotion = True, promoted_piece = color + piece))
+        else:
+            moves.append(Move(start_sq, end_sq, self.board))
 
     # get all the rook moves for the rook located at row, col and add these moves to the list
     def get_rook_moves(self, r, c, moves):
-        piece_pinned = False
-        pin_direction = ()
-        for i in range (len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                if self.board[r][c][1] != 'Q': # can't remove queen from pin on rook moves, only remove it on bishop moves
-                    self.pins.remove(self.pins[i])
-                break
-
-        directions = ((-1,0), (0, -1), (1,0),(0,1)) # up, left, down, right
-        enemy_color = 'b' if self.white_to_move else 'w'
-        for d in directions:
-            for i in range(1, 8):
-                end_row = r + d[0] * i
-                end_col = c + d[1] * i
-                if 0 <= end_row < 8 and 0 <= end_col < 8: # on board
-                    if not piece_pinned or pin_direction == d or pin_direction == (-d[0], -d[1]): # rook can move in direction of pin or opposite direction without causing check
-                        end_piece = self.board[end_row][end_col]
-                        if end_piece == '--': # empty space valid
-                            moves.append(Move((r,c), (end_row, end_col), self.board))
-                        elif end_piece[0] == enemy_color: # enemy piece valid
-                            moves.append(Move((r,c), (end_row, end_col), self.board))
-                            break
-                        else: # friendly piece invalid
-                            break
-                else: # off board
-                    break
+        self.get_slider_moves(r, c, moves, DIRECTIONS[:4])
 
     # get all the knight moves for the knight located at row, col and add these moves to the list
     def get_knight_moves(self, r, c, moves):
-        piece_pinned = False
-        for i in range (len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piece_pinned = True
-                self.pins.remove(self.pins[i])
-                break
-
-        knight_moves = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
+        if self.pin_directions[r * 8 + c] is not None: # a pinned knight can never move
+            return
+        block_mask = self.block_mask
+        board = self.board
         ally_color = 'w' if self.white_to_move else 'b'
-        for m in knight_moves:
+        for m in KNIGHT_MOVES:
             end_row = r + m[0]
             end_col = c + m[1]
             if 0 <= end_row < 8 and 0 <= end_col < 8:
-                if not piece_pinned:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece[0] != ally_color: # can't capture an ally
-                        moves.append(Move((r,c), (end_row, end_col), self.board))
+                if board[end_row][end_col][0] != ally_color and block_mask >> (end_row * 8 + end_col) & 1: # can't capture an ally
+                    moves.append(Move((r, c), (end_row, end_col), board))
 
     # get all the bishop moves for the bishop located at row, col and add these moves to the list
     def get_bishop_moves(self, r, c, moves):
-        piece_pinned = False
-        pin_direction = ()
-        for i in range (len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
-
-        directions = ((-1,-1), (-1, 1), (1,-1),(1,1)) # 4 diagonals
-        enemy_color = 'b' if self.white_to_move else 'w'
-        for d in directions:
-            for i in range(1, 8):
-                end_row = r + d[0] * i
-                end_col = c + d[1] * i
-                if 0 <= end_row < 8 and 0 <= end_col < 8: # on board
-                    if not piece_pinned or pin_direction == d or pin_direction == (-d[0], -d[1]): # bishop can move in direction of pin or opposite direction without causing check
-                        end_piece = self.board[end_row][end_col]
-                        if end_piece == '--': # empty space valid
-                            moves.append(Move((r,c), (end_row, end_col), self.board))
-                        elif end_piece[0] == enemy_color: # enemy piece valid
-                            moves.append(Move((r,c), (end_row, end_col), self.board))
-                            break
-                        else: # friendly piece invalid
-                            break
-                else: # off board
-                    break
+        self.get_slider_moves(r, c, moves, DIRECTIONS[4:])
 
     # get all the queen moves for the queen located at row, col and add these moves to the list
     def get_queen_moves(self, r, c, moves):
-        self.get_rook_moves(r, c, moves)
-        self.get_bishop_moves(r, c, moves)
+        self.get_slider_moves(r, c, moves, DIRECTIONS)
+
+    # moves of a rook, bishop or queen along directions, up to and including the first piece in the way if it is an enemy
+    def get_slider_moves(self, r, c, moves, directions):
+        pin_direction = self.pin_directions[r * 8 + c]
+        block_mask = self.block_mask
+        board = self.board
+        ally_color = 'w' if self.white_to_move else 'b'
+        for d in directions:
+            # a pinned piece can move towards the pinning piece or back towards the king, nowhere else
+            if pin_direction is not None and pin_direction != d and pin_direction != (-d[0], -d[1]):
+                continue
+            end_row, end_col = r + d[0], c + d[1]
+            while 0 <= end_row < 8 and 0 <= end_col < 8:
+                end_piece = board[end_row][end_col]
+                if end_piece[0] == ally_color: # friendly piece invalid
+                    break
+                if block_mask >> (end_row * 8 + end_col) & 1:
+                    moves.append(Move((r, c), (end_row, end_col), board))
+                if end_piece != '--': # enemy piece valid, but it ends the line
+                    break
+                end_row += d[0]
+                end_col += d[1]
 
     # get all the king moves for the king located at row, col and add these moves to the list
     def get_king_moves(self, r, c, moves):
         king_moves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
         ally_color = 'w' if self.white_to_move else 'b'
-        if self.white_to_move:
-            king_row, king_col = self.white_king_location[0], self.white_king_location[1]
-        else:
-            king_row, king_col = self.black_king_location[0], self.black_king_location[1]
+        attacked = self.get_enemy_attack_map()
         for i in range(8):
             end_row = r + king_moves[i][0]
             end_col = c + king_moves[i][1]
             if 0 <= end_row < 8 and 0 <= end_col < 8:
                 end_piece = self.board[end_row][end_col]
-                if end_piece[0] != ally_color: # can't capture an ally
-                    if ally_color == 'w':
-                        self.white_king_location = (end_row, end_col)
-                    else:
-                        self.black_king_location = (end_row, end_col)
+                if end_piece[0] != ally_color and not attacked[end_row][end_col]: # can't capture an ally or move into check
+                    moves.append(Move((r,c), (end_row, end_col), self.board))
 
-                    in_check, pins, checks = self.check_for_pins_and_checks()
-
-                    if not in_check:
-                        moves.append(Move((r,c), (end_row, end_col), self.board))
-                    # place king back on original location
-                    if ally_color == 'w':
-                        self.white_king_location = (r, c)
-                    else:
-                        self.black_king_location = (r, c)
-        
 
+    # castling moves, for a side that is not in check (get_valid_moves leaves them out in check)
     def get_castle_moves(self, r, c, moves, allyColor):
-        inCheck, _, _ = self.check_for_pins_and_checks()
-        if inCheck:
-            return # can't castle while we are in check
-        if (self.white_to_move and self.current_castling_right.wks) or (not self.white_to_move and self.current_castling_right.bks):
+        if self.count_calls:
+            self.count_call('get_castle_moves')
+        if self.castle_rights & (CastleRights.WKS if self.white_to_move else CastleRights.BKS):
             self.get_kingside_castle_moves(r, c, moves, allyColor)
-        if (self.white_to_move and self.current_castling_right.wqs) or (not self.white_to_move and self.current_castling_right.bqs):
+        if self.castle_rights & (CastleRights.WQS if self.white_to_move else CastleRights.BQS):
             self.get_queenside_castle_moves(r, c, moves, allyColor)
         
     def get_kingside_castle_moves(self, r, c, moves, allyColor):
         if self.board[r][c+1] == self.board[r][c+2] == '--':
-            if not self.square_under_attack(r, c+1) and not self.square_under_attack(r, c+2):
+            attacked = self.get_enemy_attack_map() # cached, get_king_moves made it for this position already
+            if not attacked[r][c+1] and not attacked[r][c+2]:
                 moves.append(Move((r,c), (r, c+2), self.board, pawn_promotion = False, is_castle_move = True))
     
     def get_queenside_castle_moves(self, r, c, moves, allyColor):
         if self.board[r][c-1] == self.board[r][c-2] == self.board[r][c-3] == '--':
-            if not self.square_under_attack(r, c-1) and not self.square_under_attack(r, c-2):
+            attacked = self.get_enemy_attack_map()
+            if not attacked[r][c-1] and not attacked[r][c-2]:
                 moves.append(Move((r,c), (r, c-2), self.board, pawn_promotion = False, is_castle_move = True))
 
 
-# update the castle rights given the move       
-    def update_castle_rights(self, move):
-        if move.piece_moved == 'wK':
-            self.current_castling_right.wks = False
-            self.current_castling_right.wqs = False
-        elif move.piece_moved == 'bK':
-            self.current_castling_right.bks = False
-            self.current_castling_right.bqs = False
-        elif move.piece_moved == 'wR':
-            if move.start_row == 7:
-                if move.start_col == 0: # left rook
-                    self.current_castling_right.wqs = False
-                elif move.start_col == 7: # right rook
-                    self.current_castling_right.wks = False
-        elif move.piece_moved == 'bR':
-            if move.start_row == 0:
-                if move.start_col == 0: # left rook
-                    self.current_castling_right.bqs = False
-                elif move.start_col == 7: # right rook
-                    self.current_castling_right.bks = False   
-    
-        # if a rook is captured
-        if move.piece_captured == 'wR':
-            if move.end_row == 7:
-                if move.end_col == 0:
-                    self.current_castling_right.wqs = False
-                elif move.end_col == 7:
-                    self.current_castling_right.wks = False
-        elif move.piece_captured == 'bR':
-            if move.end_row == 0:
-                if move.end_col == 0:
-                    self.current_castling_right.bqs = False
-                elif move.end_col == 7:
-                    self.current_castling_right.bks = False
-
-
 
 
 
@@ -7,23 +7,32 @@ class Move:
                    'e': 4, 'f': 5, 'g': 6, 'h': 7}
     cols_to_files = {v: k for k, v in files_to_cols.items()}
 
-    def __init__(self, start_sq, end_sq, board, is_enpassant_move = False, pawn_promotion = False, is_castle_move = False):
-        self.start_row = start_sq[0]
-        self.start_col = start_sq[1]
-        self.end_row = end_sq[0]
-        self.end_col = end_sq[1]
-        self.piece_moved = board[self.start_row][self.start_col]
-        self.piece_captured = board[self.end_row][self.end_col]
+    # fixed attributes instead of a per-move __dict__: moves are created by the million during a search
+    __slots__ = ('start_row', 'start_col', 'end_row', 'end_col', 'piece_moved', 'piece_captured', 'is_pawn_promotion',
+                 'promoted_piece', 'is_enpassant_move', 'move_id', 'is_capture', 'is_castle_move')
+
+    def __init__(self, start_sq, end_sq, board, is_enpassant_move = False, pawn_promotion = False, is_castle_move = False, promoted_piece = None):
+        start_row, start_col = start_sq
+        end_row, end_col = end_sq
+        self.start_row = start_row
+        self.start_col = start_col
+        self.end_row = end_row
+        self.end_col = end_col
+        self.piece_moved = piece_moved = board[start_row][start_col]
+        if is_enpassant_move:
+            piece_captured = 'wP' if piece_moved == 'bP' else 'bP'
+        else:
+            piece_captured = board[end_row][end_col]
+        self.piece_captured = piece_captured
         self.is_pawn_promotion = pawn_promotion
-        self.promoted_piece = None
+        self.promoted_piece = promoted_piece # eg. 'wQ', the piece that replaces the pawn
         self.is_enpassant_move = is_enpassant_move
-        if self.is_enpassant_move:
-            self.piece_captured = 'wP' if self.piece_moved == 'bP' else 'bP'
-        self.move_id = self.start_row * 1000 + self.start_col * 100 + self.end_row * 10 + self.end_col
-        self.is_capture = self.piece_captured != '--'
+        move_id = start_row * 1000 + start_col * 100 + end_row * 10 + end_col
+        if promoted_piece is not None: # promotions to different pieces are different moves
+            move_id += 10000 * ('QRBN'.index(promoted_piece[1]) + 1)
+        self.move_id = move_id
+        self.is_capture = piece_captured != '--'
         self.is_castle_move = is_castle_move
-        
-        
 
     # overriding the equals method
     def __eq__(self, other):
@@ -31,11 +40,27 @@ class Move:
             return self.move_id == other.move_id
         return False
 
+    # equal moves hash the same, so moves can be used in sets and as dict keys
+    def __hash__(self):
+        return self.move_id
+
+    # the move as a 16 bit int: end col, end row, start col and start row (rows counted from the top, as on the board)
+    # in 3 bits each from the low end, then the promotion piece (0 none, 1 N, 2 B, 3 R, 4 Q). Not the Polyglot layout,
+    # which counts ranks from white's side and writes castling differently (OpeningBook.book_move_code)
+    def encode(self):
+        code = self.end_col | self.end_row << 3 | self.start_col << 6 | self.start_row << 9
+        if self.promoted_piece is not None:
+            code |= ' NBRQ'.index(self.promoted_piece[1]) << 12
+        return code
+
     def get_rank_file(self, row, col):
         return self.cols_to_files[col] + self.rows_to_ranks[row]
     
     def get_chess_notation(self):
-        return self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col)
+        notation = self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col)
+        if self.promoted_piece is not None:
+            notation += self.promoted_piece[1].lower()
+        return notation
     
     # overriding the string function
     def __str__(self):
@@ -47,11 +72,12 @@ class Move:
         # pawn moves
         if self.piece_moved[1] == 'P':
             if self.is_capture:
-                return self.cols_to_files[self.start_col] + 'x' + end_square
+                move_string = self.cols_to_files[self.start_col] + 'x' + end_square
             else:
-                return end_square
-            
-            # TODO: pawn promotions
+                move_string = end_square
+            if self.promoted_piece is not None:
+                move_string += '=' + self.promoted_piece[1]
+            return move_string
         
         #TODO: + for check move, # for checkmate
 
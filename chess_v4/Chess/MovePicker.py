@@ -0,0 +1,88 @@
+"""
+Staged move generation for the search. A MovePicker is an iterator over the legal moves of a position in the order
+the search wants to try them, and each stage is only generated once the stages before it are used up:
+
+    hash move -> good captures -> killer moves -> quiet moves -> bad captures
+
+so a node that cuts off on the hash move never generates any other move, and one that cuts off on a capture never
+generates its quiet moves. Hash and killer moves come from other positions and are checked against the moves of the
+piece on their start square (GameState.get_piece_moves) before they are played.
+"""
+HASH_MOVE, GOOD_CAPTURES, KILLER_MOVES, QUIET_MOVES, BAD_CAPTURES = range(5)
+
+mvv_lva_values = {'K': 20, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'P': 1} # the king is the least desirable attacker
+
+
+# captures and promotions, most valuable victim first and then least valuable attacker
+def capture_order_score(move):
+    score = 0
+    if move.is_capture:
+        score += 100 * mvv_lva_values[move.piece_captured[1]] - mvv_lva_values[move.piece_moved[1]]
+    if move.promoted_piece is not None:
+        score += 100 * mvv_lva_values[move.promoted_piece[1]]
+    return score
+
+
+class MovePicker:
+    # killers: the killer moves of the ply (quiet moves that caused a cutoff there), history: the Searcher's history
+    # scores for ordering the other quiet moves
+    def __init__(self, gs, hash_move, killers, history):
+        self.gs = gs
+        self.hash_move = hash_move
+        self.killers = killers
+        self.history = history
+        self.stage = HASH_MOVE # stage of the move picked last
+
+    def __iter__(self):
+        gs = self.gs
+        # hash move
+        hash_move = self.find_move(self.hash_move)
+        if hash_move is not None:
+            yield hash_move
+
+        # captures (and promotions) that don't lose material: taking a piece worth at least as much, or an undefended one
+        self.stage = GOOD_CAPTURES
+        enemy_color = 'b' if gs.white_to_move else 'w'
+        bad_captures = []
+        for move in sorted(gs.get_capture_moves(), key = capture_order_score, reverse = True):
+            if move == hash_move:
+                continue
+            if move.is_capture and move.promoted_piece is None and \
+                    mvv_lva_values[move.piece_captured[1]] < mvv_lva_values[move.piece_moved[1]] and \
+                    gs.is_square_attacked((move.end_row, move.end_col), enemy_color):
+                bad_captures.append(move)
+                continue
+            yield move
+
+        # killer moves that are quiet moves here too
+        self.stage = KILLER_MOVES
+        killer_moves = []
+        for killer in self.killers:
+            if killer is None or killer == hash_move or killer in killer_moves:
+                continue
+            move = self.find_move(killer)
+            if move is not None and not move.is_capture and move.promoted_piece is None:
+                killer_moves.append(move)
+                yield move
+
+        # the rest of the quiet moves by history score; generating every move also sets checkmate and stalemate
+        self.stage = QUIET_MOVES
+        history = self.history
+        quiet_moves = [move for move in gs.get_valid_moves() if not move.is_capture and move.promoted_piece is None
+                       and move != hash_move and move not in killer_moves]
+        quiet_moves.sort(key = lambda move: history.get((move.piece_moved, move.end_row, move.end_col), 0), reverse = True)
+        for move in quiet_moves:
+            yield move
+
+        self.stage = BAD_CAPTURES
+        for move in bad_captures:
+            yield move
+
+    # the legal move of this position with the same squares (and promotion) as move, or None
+    def find_move(self, move):
+        if move is None:
+            return None
+        for piece_move in self.gs.get_piece_moves(move.start_row, move.start_col):
+            if piece_move == move:
+                return piece_move
+        return None
@@ -0,0 +1,183 @@
+"""
+Opening book in the Polyglot .bin format: a file of 16 byte big endian entries (key u64, move u16, weight u16,
+learn u32) sorted by key. The file is memory mapped and searched with a binary search on the key, so even a large book
+costs no loading time or memory, and a move is picked at random among the book moves in proportion to their weights.
+
+Entries are keyed and moves encoded like Polyglot (PolyglotKeys.polyglot_key; files and ranks counted from a1, castling
+as the king taking its own rook), so books made by other Polyglot tools can be read, and books written by build_book
+(or BookBuilder.py) can be used by other engines.
+"""
+import mmap
+import random
+import re
+import struct
+from Chess.GameState import GameState
+from Chess.PolyglotKeys import polyglot_key
+
+ENTRY = struct.Struct('>QHHI') # key, move, weight, learn
+KEY = struct.Struct('>Q')
+MAX_WEIGHT = 0xffff
+RESULT_WEIGHTS = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1), '*': (1, 1)} # (white's, black's) weight per game
+
+
+# the Polyglot code of a move: end file, end rank, start file and start rank in 3 bits each from the low end (ranks
+# counted from white's side), then the promotion piece (0 none, 1 N, 2 B, 3 R, 4 Q); castling is the king moving to the
+# square of its rook
+def book_move_code(move):
+    end_col = move.end_col
+    if move.is_castle_move:
+        end_col = 7 if move.end_col == 6 else 0
+    code = end_col | (7 - move.end_row) << 3 | move.start_col << 6 | (7 - move.start_row) << 9
+    if move.promoted_piece is not None:
+        code |= ' NBRQ'.index(move.promoted_piece[1]) << 12
+    return code
+
+
+class OpeningBook:
+    def __init__(self, path, rng = None):
+        self.path = path
+        self.rng = rng if rng is not None else random.Random()
+        self.file = open(path, 'rb')
+        self.file.seek(0, 2)
+        size = self.file.tell()
+        if size % ENTRY.size:
+            self.file.close()
+            raise ValueError(f'{path} is not a Polyglot book: its size is not a multiple of {ENTRY.size} bytes')
+        self.entries = size // ENTRY.size
+        # an empty file can't be mapped, but an empty book is still a book
+        self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ) if size else b''
+
+    def __len__(self):
+        return self.entries
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # [(move code, weight)] of the entries with this key; a binary search for the first one, then a scan
+    def find(self, key):
+        low, high = 0, self.entries
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self.data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        for i in range(low, self.entries):
+            entry_key, code, weight, _ = ENTRY.unpack_from(self.data, i * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((code, weight))
+        return found
+
+    # [(move, weight)] of the book moves in this position that are in valid_moves (so a key collision can't play an
+    # illegal move)
+    def get_moves(self, gs, valid_moves):
+        moves_by_code = {book_move_code(move): move for move in valid_moves}
+        return [(moves_by_code[code], weight) for code, weight in self.find(polyglot_key(gs))
+                if code in moves_by_code and weight > 0]
+
+    # a book move picked at random in proportion to the weights, or None when the position is out of book
+    def choose_move(self, gs, valid_moves):
+        book_moves = self.get_moves(gs, valid_moves)
+        if not book_moves:
+            return None
+        pick = self.rng.randrange(sum(weight for _, weight in book_moves))
+        for move, weight in book_moves:
+            if pick < weight:
+                return move
+            pick -= weight
+
+
+# the movetext of a PGN game without comments, variations, annotations, move numbers and the result
+_comment = re.compile(r'\{[^}]*\}|;[^\n]*')
+_variation = re.compile(r'\([^()]*\)')
+_noise = re.compile(r'\$\d+|\d+\.+|1-0|0-1|1/2-1/2|\*')
+
+
+# yield (result, [SAN moves]) for every game in a PGN file, reading it a line at a time
+def read_pgn_games(path):
+    with open(path, encoding = 'utf-8', errors = 'replace') as file:
+        result = '*'
+        movetext = []
+        for line in file:
+            line = line.strip()
+            if line.startswith('['):
+                if movetext: # the tags of the next game
+                    yield result, parse_movetext(' '.join(movetext))
+                    result = '*'
+                    movetext = []
+                tag = re.match(r'\[Result\s+"([^"]*)"\]', line)
+                if tag:
+                    result = tag.group(1)
+            elif line and not line.startswith('%'):
+                movetext.append(line)
+        if movetext:
+            yield result, parse_movetext(' '.join(movetext))
+
+
+def parse_movetext(text):
+    text = _comment.sub(' ', text)
+    while True: # variations can be nested, so remove the innermost ones until none are left
+        text, removed = _variation.subn(' ', text)
+        if not removed:
+            break
+    return _noise.sub(' ', text).split()
+
+
+# SAN without check marks and annotations, and castling with letter O, so PGN moves compare equal to get_san
+def clean_san(san):
+    return san.rstrip('+#!?').replace('0', 'O')
+
+
+# the valid move written as san, or None. get_san plays the move to look for check, so it is only asked about the moves
+# that go to the right square
+def find_san_move(gs, valid_moves, san):
+    target = clean_san(san)
+    castle = target.startswith('O')
+    for move in valid_moves:
+        if move.is_castle_move != castle:
+            continue
+        if not castle and move.get_rank_file(move.end_row, move.end_col) not in target:
+            continue
+        if clean_san(gs.get_san(move)) == target:
+            return move
+    return None
+
+
+# build a book from PGN files: every position of the first max_plies plies of each game gets an entry for the move
+# played, weighted 2 for a win, 1 for a draw and 0 for a loss of the side that played it, summed over the games;
+# moves seen in fewer than min_games games are left out. Returns (games read, entries written)
+def build_book(pgn_paths, book_path, max_plies = 20, min_games = 1):
+    counts = {} # (key, code) -> [games, weight]
+    games = 0
+    for pgn_path in pgn_paths:
+        for result, sans in read_pgn_games(pgn_path):
+            games += 1
+            weights = RESULT_WEIGHTS.get(result, (1, 1))
+            gs = GameState()
+            for san in sans[:max_plies]:
+                move = find_san_move(gs, gs.get_valid_moves(), san)
+                if move is None: # illegal or unreadable move: keep what was read before it
+                    break
+                count = counts.setdefault((polyglot_key(gs), book_move_code(move)), [0, 0])
+                count[0] += 1
+                count[1] += weights[0] if gs.white_to_move else weights[1]
+                gs.make_move(move)
+
+    entries = [(key, code, weight) for (key, code), (seen, weight) in counts.items() if seen >= min_games and weight > 0]
+    largest = max((weight for _, _, weight in entries), default = 0)
+    with open(book_path, 'wb') as file:
+        for key, code, weight in sorted(entries, key = lambda entry: (entry[0], -entry[2])):
+            if largest > MAX_WEIGHT: # scale down to fit in 16 bits, keeping every move playable
+                weight = max(1, weight * MAX_WEIGHT // largest)
+            file.write(ENTRY.pack(key, code, weight, 0))
+    return games, len(entries)
@@ -0,0 +1,71 @@
+"""
+Reads positions from FEN and EPD files (one position per line) for test suites and batch analysis.
+Files are read lazily a line at a time, so files with millions of positions don't have to fit in memory; files ending
+in .gz are decompressed on the fly
+"""
+import gzip
+from Chess.GameState import GameState
+
+
+# split one FEN or EPD line into (fen, operations). EPD lines have the 4 position fields followed by operations like
+# 'bm Nf3; id "test 1";' which are returned as a dict of opcode -> operand string ({'bm': 'Nf3', 'id': 'test 1'});
+# FEN lines have the 2 move counters instead. Returns None for blank lines and comments starting with #
+def parse_line(line):
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError(f'not a FEN or EPD position: {line!r}')
+    fen = ' '.join(fields[:4])
+    rest = fields[4] if len(fields) > 4 else ''
+    counters = rest.split(None, 2)
+    if len(counters) >= 2 and counters[0].isdigit() and counters[1].isdigit(): # FEN move counters
+        fen += f' {counters[0]} {counters[1]}'
+        rest = counters[2] if len(counters) > 2 else ''
+    return fen, parse_operations(rest)
+
+
+# 'bm Nf3 Ng5; id "a;b";' -> {'bm': 'Nf3 Ng5', 'id': 'a;b'}; semicolons inside quotes don't end an operation
+def parse_operations(text):
+    operations = {}
+    operation = ''
+    quoted = False
+    for char in text + ';':
+        if char == '"':
+            quoted = not quoted
+        elif char == ';' and not quoted:
+            opcode, _, operand = operation.strip().partition(' ')
+            if opcode:
+                operations[opcode] = operand.strip().replace('"', '')
+            operation = ''
+            continue
+        operation += char
+    return operations
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    return open(path)
+
+
+# yield (fen, operations) for every position in the file, reading it a line at a time
+def read_positions(path):
+    with open_text(path) as file:
+        for line in file:
+            position = parse_line(line)
+            if position is not None:
+                yield position
+
+
+# yield (GameState, operations) for every position in the file. To make loading fast one GameState is set to each
+# position in turn, so copy anything you need from it before asking for the next position (or pass reuse = False)
+def load_positions(path, engine = 'mailbox', reuse = True):
+    gs = None
+    for fen, operations in read_positions(path):
+        if gs is None or not reuse:
+            gs = GameState.from_fen(fen, engine)
+        else:
+            gs.set_fen(fen)
+        yield gs, operations
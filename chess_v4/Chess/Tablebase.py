@@ -0,0 +1,345 @@
+"""
+Endgame tablebases for positions with up to 4 pieces (kings included), built by retrograde analysis with the
+GameState move generator and probed from memory mapped files.
+
+A table holds one material balance, eg. KQvK or KRvKP (white's pieces first), in a file of one byte per position:
+0 for a draw, an odd number d when the side to move mates in d plies, an even number d + 2 when the side to move is
+mated in d plies, and 255 for impossible positions (two pieces on a square, pawns on the back ranks, the side not to
+move in check). Positions are numbered by the side to move and the squares of the pieces in PIECE_ORDER (a8 = 0 to
+h1 = 63), so a table of n pieces has 2 * 64^n entries: 512KB for 3 pieces and 32MB for 4. A table also answers for its
+color reversed position, so KvKQ is looked up in KQvK.
+
+Tables assume no castling rights and ignore en passant captures and the fifty move rule; positions with castling rights
+or a possible en passant capture are not probed. Building needs the tables of every material the table can capture or
+promote into, which build_table makes first. 3 piece tables take about a minute each; 4 piece tables take hours and
+several GB of memory in pure Python.
+"""
+import itertools
+import mmap
+import os
+import time
+from array import array
+from Chess.GameState import GameState
+
+PIECE_ORDER = ('wK', 'wQ', 'wR', 'wB', 'wN', 'wP', 'bK', 'bQ', 'bR', 'bB', 'bN', 'bP')
+piece_ranks = {piece: i for i, piece in enumerate(PIECE_ORDER)}
+MAX_PIECES = 4
+TABLEBASE_PATH = 'tablebases' # folder the tables are built into and probed from
+TABLE_SUFFIX = '.tb'
+
+DRAW = 0
+ILLEGAL = 255
+MAX_DTM = 253 # longest distance to mate (plies) a byte can hold
+
+
+# value byte -> (wdl, dtm): wdl is 1 if the side to move wins, 0 for a draw and -1 if it loses; dtm is the number of
+# plies to mate (None for a draw)
+def decode(value):
+    if value == DRAW:
+        return 0, None
+    if value % 2 == 1:
+        return 1, value
+    return -1, value - 2
+
+
+# distance to mate in plies -> value byte; odd distances are wins for the side to move, even ones losses
+def encode(dtm):
+    return dtm if dtm % 2 == 1 else dtm + 2
+
+
+# 'KQvKR' -> ['wK', 'wQ', 'bK', 'bR'] (in PIECE_ORDER)
+def parse_material(name):
+    white, separator, black = name.partition('v')
+    if not separator or white.count('K') != 1 or black.count('K') != 1:
+        raise ValueError(f'material {name!r} should look like KQvK: the pieces of each side, one king each')
+    pieces = []
+    for color, letters in (('w', white), ('b', black)):
+        for letter in letters:
+            if letter not in 'KQRBNP':
+                raise ValueError(f'unknown piece {letter!r} in material {name!r}')
+            pieces.append(color + letter)
+    if len(pieces) > MAX_PIECES:
+        raise ValueError(f'material {name!r} has more than {MAX_PIECES} pieces')
+    return sorted(pieces, key = piece_ranks.get)
+
+
+# ['wK', 'wQ', 'bK'] -> 'KQvK'
+def material_name(pieces):
+    pieces = sorted(pieces, key = piece_ranks.get)
+    return ''.join(p[1] for p in pieces if p[0] == 'w') + 'v' + ''.join(p[1] for p in pieces if p[0] == 'b')
+
+
+def count_pieces(gs):
+    return sum(piece != '--' for row in gs.board for piece in row)
+
+
+# the pieces of the position as a sorted list of (piece, square) pairs, the form tables are indexed by
+def get_placement(gs):
+    return sorted(((piece, r * 8 + c) for r, row in enumerate(gs.board) for c, piece in enumerate(row) if piece != '--'),
+                  key = lambda pair: (piece_ranks[pair[0]], pair[1]))
+
+
+def position_index(placement, white_to_move):
+    index = 0 if white_to_move else 1
+    for _, square in placement:
+        index = index * 64 + square
+    return index
+
+
+# the same position with the colors swapped and the board mirrored top to bottom
+def flip_placement(placement):
+    flipped = [(('b' if piece[0] == 'w' else 'w') + piece[1], square ^ 56) for piece, square in placement]
+    return sorted(flipped, key = lambda pair: (piece_ranks[pair[0]], pair[1]))
+
+
+def placement_fen(placement, white_to_move):
+    letters = {square: piece[1] if piece[0] == 'w' else piece[1].lower() for piece, square in placement}
+    fen = ''
+    for row in range(8):
+        empty = 0
+        for square in range(row * 8, row * 8 + 8):
+            if square in letters:
+                if empty:
+                    fen += str(empty)
+                    empty = 0
+                fen += letters[square]
+            else:
+                empty += 1
+        if empty:
+            fen += str(empty)
+        if row < 7:
+            fen += '/'
+    return fen + (' w - - 0 1' if white_to_move else ' b - - 0 1')
+
+
+class Tablebase:
+    def __init__(self, path = TABLEBASE_PATH):
+        self.path = path
+        self.tables = {} # material name -> mmap of its file, or None when there is no table
+        self.files = []
+        self.max_pieces = 0 # most pieces of any table in the folder; positions with more aren't probed
+        if os.path.isdir(path):
+            for file_name in os.listdir(path):
+                if file_name.endswith(TABLE_SUFFIX):
+                    self.max_pieces = max(self.max_pieces, len(parse_material(file_name[:-len(TABLE_SUFFIX)])))
+
+    def get_table(self, name):
+        if name not in self.tables:
+            table = None
+            file_name = os.path.join(self.path, name + TABLE_SUFFIX)
+            if os.path.exists(file_name):
+                file = open(file_name, 'rb')
+                self.files.append(file)
+                table = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+            self.tables[name] = table
+        return self.tables[name]
+
+    # True if a table (or its color reversed table) exists for the material
+    def has_table(self, pieces):
+        if len(pieces) == 2:
+            return True
+        return self.get_table(material_name(pieces)) is not None or \
+            self.get_table(material_name([('b' if p[0] == 'w' else 'w') + p[1] for p in pieces])) is not None
+
+    # the value byte of a position given as a placement, or None without a table for its material
+    def probe_value(self, placement, white_to_move):
+        if len(placement) == 2: # bare kings
+            return DRAW
+        table = self.get_table(material_name([piece for piece, _ in placement]))
+        if table is None:
+            placement = flip_placement(placement)
+            white_to_move = not white_to_move
+            table = self.get_table(material_name([piece for piece, _ in placement]))
+            if table is None:
+                return None
+        return table[position_index(placement, white_to_move)]
+
+    # (wdl, dtm) of the position for the side to move (see decode), or None if it isn't in the tables
+    def probe(self, gs):
+        if gs.castle_rights:
+            return None
+        if gs.enpassant_possible != (): # only matters if a pawn could take en passant
+            row, col = gs.enpassant_possible
+            pawn = 'wP' if gs.white_to_move else 'bP'
+            pawn_row = row + 1 if gs.white_to_move else row - 1
+            if any(0 <= c < 8 and gs.board[pawn_row][c] == pawn for c in (col - 1, col + 1)):
+                return None
+        placement = get_placement(gs)
+        if len(placement) > self.max_pieces:
+            return None
+        value = self.probe_value(placement, gs.white_to_move)
+        if value is None or value == ILLEGAL:
+            return None
+        return decode(value)
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        for file in self.files:
+            file.close()
+        self.tables = {}
+        self.files = []
+
+    # memory maps can't be pickled; a copy sent to another process opens the files again
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+
+# the materials a position of these pieces can turn into with one capture or promotion
+def successor_materials(pieces):
+    results = set()
+    for i, piece in enumerate(pieces):
+        if piece[1] != 'K': # captured
+            results.add(material_name(pieces[:i] + pieces[i + 1:]))
+        if piece[1] == 'P': # promoted, possibly capturing
+            for promoted in 'QRBN':
+                promoted_pieces = pieces[:i] + [piece[0] + promoted] + pieces[i + 1:]
+                results.add(material_name(promoted_pieces))
+                for j, captured in enumerate(promoted_pieces):
+                    if captured[0] != piece[0] and captured[1] != 'K':
+                        results.add(material_name(promoted_pieces[:j] + promoted_pieces[j + 1:]))
+    return results
+
+
+# squares that make a position of these pieces worth listing: all different, no pawns on the back ranks and pieces of
+# the same kind in increasing order, so each position has exactly one index
+def usable_squares(pieces, squares):
+    if len(set(squares)) != len(squares):
+        return False
+    for i, piece in enumerate(pieces):
+        if piece[1] == 'P' and not 8 <= squares[i] < 56:
+            return False
+        if i > 0 and pieces[i - 1] == piece and squares[i - 1] > squares[i]:
+            return False
+    return True
+
+
+# build the table of a material (eg. 'KRvK') into the folder path, after the tables it depends on. report, if given,
+# is called with progress messages. Returns the file name of the table
+def build_table(name, path = TABLEBASE_PATH, engine = 'bitboard', report = None):
+    pieces = parse_material(name)
+    name = material_name(pieces)
+    file_name = os.path.join(path, name + TABLE_SUFFIX)
+    os.makedirs(path, exist_ok = True)
+    for successor in sorted(successor_materials(pieces)):
+        successor_pieces = parse_material(successor)
+        tablebase = Tablebase(path)
+        if not tablebase.has_table(successor_pieces):
+            build_table(successor, path, engine, report)
+        tablebase.close()
+    if report is not None:
+        report(f'building {name}')
+    build_start = time.perf_counter()
+    tablebase = Tablebase(path) # the tables captures and promotions lead into
+
+    n = len(pieces)
+    size = 2 * 64 ** n
+    values = bytearray(size) # value bytes; positions left at 0 when the analysis is done are draws
+    final = bytearray(size) # 1 once a position's value is known for sure
+    unresolved = array('H', bytes(2 * size)) # moves to positions in this table that aren't known wins for the opponent
+    loss_dtm = bytearray(size) # distance to mate if all moves turn out to lose: 1 + the longest win of the opponent
+    can_draw = bytearray(size) # 1 if a capture or promotion reaches a draw or a win, so the position can't be lost
+    buckets = [[] for _ in range(MAX_DTM + 1)] # positions found to be won or lost, by distance to mate
+    edge_child = array('I') # moves inside the table, as (position after, position before) index pairs
+    edge_parent = array('I')
+
+    # forward pass: play every move of every position once
+    gs = GameState(engine)
+    repeated_pieces = len(set(pieces)) < n # two pieces of a kind have to be kept in order after a move
+    positions = 0
+    for squares in itertools.product(range(64), repeat = n):
+        if not usable_squares(pieces, squares):
+            continue
+        placement = list(zip(pieces, squares))
+        in_check = {}
+        moves = {}
+        for white_to_move in (True, False):
+            gs.set_fen(placement_fen(placement, white_to_move))
+            moves[white_to_move] = gs.get_valid_moves()
+            in_check[white_to_move] = gs.in_check
+        for white_to_move in (True, False):
+            index = position_index(placement, white_to_move)
+            if in_check[not white_to_move]: # the side to move could take the king
+                values[index] = ILLEGAL
+                final[index] = 1
+                continue
+            positions += 1
+            if not moves[white_to_move]:
+                if in_check[white_to_move]:
+                    buckets[0].append(index) # checkmated
+                else:
+                    final[index] = 1 # stalemate
+                continue
+            for move in moves[white_to_move]:
+                start = move.start_row * 8 + move.start_col
+                end = move.end_row * 8 + move.end_col
+                if not move.is_capture and move.promoted_piece is None: # same material, only one square changes
+                    child = list(placement)
+                    child[squares.index(start)] = (move.piece_moved, end)
+                    if repeated_pieces:
+                        child.sort(key = lambda pair: (piece_ranks[pair[0]], pair[1]))
+                    edge_child.append(position_index(child, not white_to_move))
+                    edge_parent.append(index)
+                    unresolved[index] += 1
+                    continue
+                child = [(piece, square) for piece, square in placement if square != start and square != end]
+                child.append((move.promoted_piece or move.piece_moved, end))
+                child.sort(key = lambda pair: (piece_ranks[pair[0]], pair[1]))
+                wdl, dtm = decode(tablebase.probe_value(child, not white_to_move))
+                if wdl == -1: # the opponent gets mated
+                    buckets[dtm + 1].append(index)
+                    can_draw[index] = 1 # the retrograde pass must not find it lost first, in a shorter loss bucket
+                elif wdl == 0:
+                    can_draw[index] = 1
+                elif dtm + 1 > loss_dtm[index]:
+                    loss_dtm[index] = dtm + 1
+            if not unresolved[index] and not can_draw[index]: # every move captures or promotes into a loss
+                buckets[loss_dtm[index]].append(index)
+    tablebase.close()
+
+    # the positions each position can be reached from, grouped by position (compressed sparse rows)
+    counts = array('I', bytes(4 * size))
+    for child in edge_child:
+        counts[child] += 1
+    starts = array('I', itertools.accumulate(counts, initial = 0))
+    fill = array('I', starts)
+    parents = array('I', bytes(4 * len(edge_child)))
+    for child, parent in zip(edge_child, edge_parent):
+        parents[fill[child]] = parent
+        fill[child] += 1
+    del edge_child, edge_parent, counts, fill
+
+    # retrograde pass: settle positions in order of distance to mate. A position one move before a loss is a win; a
+    # position whose moves all lead to wins for the opponent is a loss, as far from mate as the longest of those wins
+    for dtm, bucket in enumerate(buckets):
+        won = dtm % 2 == 1
+        for index in bucket:
+            if final[index]:
+                continue
+            final[index] = 1
+            values[index] = encode(dtm)
+            if dtm == MAX_DTM:
+                continue
+            for parent in parents[starts[index]:starts[index + 1]]:
+                if final[parent]:
+                    continue
+                if not won:
+                    buckets[dtm + 1].append(parent)
+                    continue
+                unresolved[parent] -= 1
+                if dtm + 1 > loss_dtm[parent]:
+                    loss_dtm[parent] = dtm + 1
+                if not unresolved[parent] and not can_draw[parent]:
+                    buckets[loss_dtm[parent]].append(parent)
+        bucket.clear()
+
+    with open(file_name, 'wb') as file:
+        file.write(values)
+    if report is not None:
+        wins = sum(1 for value in values if value != ILLEGAL and value % 2 == 1)
+        report(f'{name}: {positions} positions, {wins} won for the side to move, {time.perf_counter() - build_start:.0f}s')
+    return file_name
@@ -0,0 +1,60 @@
+"""
+Fixed size hash table of previously searched positions, indexed by GameState.zobrist_key
+"""
+
+# bound types: how the stored score relates to the real score of the position
+EXACT = 0 # score is exact (searched inside the alpha beta window)
+LOWER_BOUND = 1 # score failed high (beta cutoff), real score is at least this
+UPPER_BOUND = 2 # score failed low, real score is at most this
+
+
+class TranspositionTable:
+    def __init__(self, size = 1 << 18):
+        self.size = 1 << (size.bit_length() - 1) # round down to a power of 2 so the index is a cheap mask
+        self.mask = self.size - 1
+        # each slot is None or a tuple (key, depth, score, bound, best_move, age)
+        self.table = [None] * self.size
+        self.age = 0 # incremented every search so entries from old searches get replaced first
+        self.probes = 0
+        self.hits = 0
+
+    # empty the table
+    def clear(self):
+        self.table = [None] * self.size
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+
+    # call at the start of each search
+    def new_search(self):
+        self.age += 1
+
+    # returns the entry stored for this key or None
+    def probe(self, key):
+        self.probes += 1
+        entry = self.table[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    # store a search result. An entry from the current search is only replaced by one searched at least as deep,
+    # entries from older searches are always replaced
+    def store(self, key, depth, score, bound, best_move):
+        index = key & self.mask
+        entry = self.table[index]
+        if entry is not None and entry[5] == self.age and depth < entry[1]:
+            return
+        if entry is not None and entry[0] == key and best_move is None:
+            best_move = entry[4] # keep the old best move if we don't have a new one
+        self.table[index] = (key, depth, score, bound, best_move, self.age)
+
+    # per mille of slots used by the current search (as reported by UCI hashfull)
+    def hashfull(self):
+        sample = min(1000, self.size)
+        used = 0
+        for i in range(sample):
+            entry = self.table[i]
+            if entry is not None and entry[5] == self.age:
+                used += 1
+        return used * 1000 // sample
@@ -0,0 +1,47 @@
+"""
+Zobrist keys used to hash a GameState into a single 64 bit integer.
+The key is updated incrementally in GameState.make_move and restored from the undo stack in GameState.undo_move
+"""
+import random
+
+PIECES = ['wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK']
+
+# fixed seed so keys (and anything stored with them, like the transposition table) are the same on every run
+_rng = random.Random(0x5EED)
+
+# piece_keys[piece][row][col]
+piece_keys = {piece: [[_rng.getrandbits(64) for _ in range(8)] for _ in range(8)] for piece in PIECES}
+# xored in when it is black's turn
+black_to_move_key = _rng.getrandbits(64)
+# one key for every combination of the 4 castle rights (indexed by the GameState.castle_rights bits)
+castle_keys = [_rng.getrandbits(64) for _ in range(16)]
+# one key per file of the en passant square, only hashed in when a pawn could take there (see enpassant_key)
+enpassant_keys = [_rng.getrandbits(64) for _ in range(8)]
+
+
+# the key of gs.enpassant_possible if a pawn of the side to move stands next to the pawn that just moved two squares,
+# else 0. Like Polyglot, so a position after a double pawn push hashes the same as the position without an en passant
+# square when nobody can take en passant (for the opening book, the transposition table and repetitions)
+def enpassant_key(gs):
+    row, col = gs.enpassant_possible
+    pawn = 'wP' if gs.white_to_move else 'bP'
+    pawn_row = gs.board[row + 1 if gs.white_to_move else row - 1]
+    if (col > 0 and pawn_row[col - 1] == pawn) or (col < 7 and pawn_row[col + 1] == pawn):
+        return enpassant_keys[col]
+    return 0
+
+
+# hash the whole position from scratch; used to initialize the key and to verify the incremental updates
+def hash_position(gs):
+    key = 0
+    for r in range(8):
+        for c in range(8):
+            piece = gs.board[r][c]
+            if piece != '--':
+                key ^= piece_keys[piece][r][c]
+    if not gs.white_to_move:
+        key ^= black_to_move_key
+    key ^= castle_keys[gs.castle_rights]
+    if gs.enpassant_possible != ():
+        key ^= enpassant_key(gs)
+    return key
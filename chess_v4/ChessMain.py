@@ -2,8 +2,10 @@
 Responsible for storing all the information about the current state of a chess game, as well as determining the valid moves at the current state. 
 It will also keep a move log
 """
+import os
 import pygame as p
 from Chess import GameState, AI
+from Chess.Tablebase import Tablebase
 
 
 
@@ -17,6 +19,9 @@ MENU_ITEM_WIDTH = 300
 DIMENSION = 8 # dimensions of a chess board are 8x8
 SQ_SIZE = BOARD_HEIGHT // DIMENSION
 MAX_FPS = 15
+ENGINE = 'mailbox' # move generator used by GameState: 'mailbox' or 'bitboard'
+BOOK_PATH = 'book.bin' # opening book the AI plays from when the file exists (build one with BookBuilder.py)
+TABLEBASE_PATH = 'tablebases' # endgame tables the AI plays from when the folder exists (build them with TablebaseBuilder.py)
 IMAGES = {}
 
 # initialize a global dictionary of images
@@ -31,12 +36,14 @@ def load_images():
 def main():
 
     p.init()
+    if os.path.exists(BOOK_PATH):
+        AI.load_opening_book(BOOK_PATH)
     screen = p.display.set_mode((BOARD_WIDTH + MOVE_LOG_PANEL_WIDTH, BOARD_HEIGHT))
     clock = p.time.Clock()
     screen.fill(p.Color('white'))
     move_log_font = p.font.SysFont('Lustria', 20, False, False)
     menu_font = p.font.SysFont('Lustria', 40, False, False)
-    gs = GameState.GameState()
+    gs = GameState.GameState(ENGINE)
     valid_moves = gs.get_valid_moves()
     move_made = False # flag variable for when a move is made
     animate = False # flag variable for when we shoud animate a move
@@ -50,6 +57,9 @@ def main():
     game_open = True
     global max_depth
     max_depth = 3
+    tablebase = Tablebase(TABLEBASE_PATH) if os.path.isdir(TABLEBASE_PATH) else None
+    searcher = AI.Searcher(tablebase = tablebase) # keeps its transposition table between the AI's moves
+    ai_search = None # AI.BackgroundSearch while the AI is thinking
     
     
     # menu loop
@@ -70,6 +80,9 @@ def main():
         for e in p.event.get():
             if e.type == p.QUIT:
                 game_open = False
+                if ai_search is not None:
+                    ai_search.cancel()
+                    ai_search = None
 
 
 
@@ -87,17 +100,18 @@ def main():
                         player_clicks.append(sq_selected) # append for both first and second clicks
                     if len(player_clicks) == 2: # after the second click
                         move = GameState.Move(player_clicks[0], player_clicks[1], gs.board)
+                        if gs.check_pawn_promotion(move):
+                            # ask what to promote to, if this pawn can actually move there
+                            for valid_move in valid_moves:
+                                if valid_move.is_pawn_promotion and valid_move.encode() & 0xfff == move.encode():
+                                    piece = display_promotion_popup(screen)
+                                    move = GameState.Move(player_clicks[0], player_clicks[1], gs.board, pawn_promotion = True,
+                                                          promoted_piece = move.piece_moved[0] + piece)
+                                    p.display.flip()
+                                    break
                         for i in range (len(valid_moves)):
                             if move == valid_moves[i]:
-                                gs.make_move(move) # switches turn
-                                if gs.check_pawn_promotion(move):
-                                        piece = display_promotion_popup(screen)
-                                        if gs.white_to_move: # white turn now => black promoted before
-                                                gs.board[move.end_row][move.end_col] = 'b' + str(piece) # replace pawn with promotion
-                                        else:
-                                                gs.board[move.end_row][move.end_col] = 'w' + str(piece)
-                                        p.display.flip()
-                        
+                                gs.make_move(valid_moves[i]) # switches turn; the generated move knows about en passant, castling and promotion
                                 move_made = True
                                 animate = True
                                 sq_selected = () # reset user clicks
@@ -110,14 +124,20 @@ def main():
             # key handlers
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_z: # undo when 'z' is pressed
-                    if player_two is False: # if playing against AI, reverse the AI's move as well (call undo_move twice)
+                    if ai_search is not None: # the AI is thinking about a reply, stop it and take back the player's move
+                        ai_search.cancel()
+                        ai_search = None
+                    elif player_two is False: # if playing against AI, reverse the AI's move as well (call undo_move twice)
                         gs.undo_move()
                     gs.undo_move()
                     move_made = True
                     animate = False
                     game_over = False
                 if e.key == p.K_r: # reset the biard when 'r' is pressed
-                    gs = GameState.GameState()
+                    if ai_search is not None:
+                        ai_search.cancel()
+                        ai_search = None
+                    gs = GameState.GameState(ENGINE)
                     valid_moves = gs.get_valid_moves()
                     sq_selected = ()
                     player_clicks = []
@@ -129,19 +149,25 @@ def main():
                     
 
 
-        # AI move finder
-        if not game_over and not human_turn:
-            ai_move = AI.find_best_move(gs, valid_moves, max_depth)
-            if ai_move is None:
-                ai_move = AI.find_random_move(valid_moves)
-            gs.make_move(ai_move)
-            if ai_move.piece_moved == 'bP' and gs.check_pawn_promotion(ai_move):
-                print('test')
-                # AI should always pick queen
-                gs.board[ai_move.end_row][ai_move.end_col] = 'bQ' # replace pawn with promotion
-                p.display.flip()
-            move_made = True
-            animate = True
+        # AI move finder; the search runs in a background thread so the window keeps responding while it thinks
+        if game_open and not game_over and not human_turn and not move_made:
+            book_move = AI.find_book_move(gs, valid_moves) if ai_search is None else None
+            if book_move is not None:
+                gs.make_move(book_move)
+                move_made = True
+                animate = True
+            elif ai_search is None:
+                ai_search = AI.BackgroundSearch(searcher, gs, max_depth)
+            elif ai_search.done():
+                result = ai_search.result
+                ai_search = None
+                print(result)
+                ai_move = result.best_move
+                if ai_move is None:
+                    ai_move = AI.find_random_move(valid_moves)
+                gs.make_move(ai_move)
+                move_made = True
+                animate = True
 
 
         # make move
@@ -165,6 +191,8 @@ def main():
 
 
         draw_game_state(screen, gs, valid_moves, sq_selected, move_log_font, menu_font, menu_open)
+        if ai_search is not None:
+            draw_thinking_text(screen, searcher, move_log_font)
         clock.tick(MAX_FPS)
         p.display.flip()
     
@@ -273,6 +301,15 @@ def draw_move_log(screen, gs, move_log_font):
         text_y += text_object.get_height() + line_spacing
 
 
+# show that the AI is searching, with the depth and nodes searched so far, at the bottom of the move log panel
+def draw_thinking_text(screen, searcher, font):
+    stats = searcher.stats
+    text = f'Thinking... depth {searcher.depth}, {stats.nodes + stats.quiescence_nodes} nodes'
+    text_object = font.render(text, True, p.Color('white'))
+    padding = 5
+    screen.blit(text_object, (BOARD_WIDTH + padding, MOVE_LOG_PANEL_HEIGHT - text_object.get_height() - padding))
+
+
 # display menu
 def display_menu(screen, menu_font):
     global player_one
@@ -390,7 +427,6 @@ def draw_end_game_text(screen, text):
         screen.blit(text_object, text_location)
         p.display.flip()
 
-   
-
-main()
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Evaluation parity check.
+Plays seeded random games with both move generators and checks, for every position reached, that
+    Evaluator.evaluate matches the original score_board: the material and piece-square scores summed over the board
+    from PieceScores plus 0.7 for every move that gives check, found by playing each move
+    BatchEvaluator scores (from GameStates, from FEN strings and from one-hot planes) match the running
+    material_score + position_score of GameState
+Exits with status 1 if any score differs. The batch check needs NumPy and is skipped without it.
+
+    python EvaluationCheck.py                  # 40 games of up to 80 plies with each generator
+    python EvaluationCheck.py --games 200 --seed 7
+"""
+import argparse
+import random
+import sys
+from Chess.GameState import GameState
+from Chess.Evaluator import Evaluator, CHECKMATE, STALEMATE
+from Chess.PieceScores import piece_score, piece_position_scores
+
+CHECK_WEIGHT = 0.7 # the original score_board's bonus per checking move
+TOLERANCE = 1e-9 # the scores are sums of floats in a different order
+
+
+# the original score_board: scan the board for material and piece-square scores, play every move to count checks
+def reference_score(gs, valid_moves):
+    if gs.checkmate:
+        return -CHECKMATE if gs.white_to_move else CHECKMATE
+    elif gs.stalemate:
+        return STALEMATE
+    score = 0
+    for row in range(8):
+        for col in range(8):
+            piece = gs.board[row][col]
+            if piece != '--':
+                value = piece_score[piece[1]]
+                if piece[1] != 'K':
+                    value += piece_position_scores[piece][row][col]
+                score += value if piece[0] == 'w' else -value
+    for move in valid_moves:
+        gs.make_move(move) # will switch players
+        if gs.is_in_check():
+            score += CHECK_WEIGHT if not gs.white_to_move else -CHECK_WEIGHT
+        gs.undo_move()
+    return score
+
+
+# the positions of seeded random games, as (fen, GameState set up from it)
+def random_positions(engine, games, plies, seed):
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(games):
+        gs = GameState(engine)
+        for _ in range(plies):
+            moves = gs.get_valid_moves()
+            fen = gs.to_fen()
+            positions.append((fen, GameState.from_fen(fen, engine)))
+            if not moves:
+                break
+            gs.make_move(rng.choice(moves))
+    return positions
+
+
+# Evaluator against the original score_board; returns the number of positions that differ
+def check_evaluator(positions):
+    evaluator = Evaluator()
+    failures = 0
+    for fen, gs in positions:
+        valid_moves = gs.get_valid_moves()
+        expected = reference_score(gs, valid_moves)
+        score = evaluator.evaluate(gs, valid_moves)
+        if abs(score - expected) > TOLERANCE:
+            failures += 1
+            if failures <= 10:
+                print(f'  {fen}: Evaluator {score}, score_board {expected}')
+    return failures
+
+
+# BatchEvaluator against the running scores of GameState; returns the number of positions that differ, or None
+# without NumPy
+def check_batch(positions):
+    try:
+        from Chess import BatchEvaluator
+    except ImportError:
+        return None
+    game_states = [gs for _, gs in positions]
+    fens = [fen for fen, _ in positions]
+    expected = [gs.material_score + gs.position_score for gs in game_states]
+    codes = BatchEvaluator.encode_game_states(game_states)
+    batches = {'game states': BatchEvaluator.evaluate_codes(codes),
+               'fens': BatchEvaluator.evaluate_fens(fens),
+               'planes': BatchEvaluator.evaluate_planes(BatchEvaluator.to_planes(codes))}
+    failures = 0
+    for i, (fen, _) in enumerate(positions):
+        wrong = [name for name, scores in batches.items() if scores[i] != expected[i]]
+        if wrong:
+            failures += 1
+            if failures <= 10:
+                print(f'  {fen}: GameState {expected[i]}, ' + ', '.join(f'{name} {batches[name][i]}' for name in wrong))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'check the evaluators against the original scoring')
+    parser.add_argument('--games', type = int, default = 40, help = 'random games per move generator (default 40)')
+    parser.add_argument('--plies', type = int, default = 80, help = 'longest game in plies (default 80)')
+    parser.add_argument('--seed', type = int, default = 1, help = 'seed of the random games (default 1)')
+    args = parser.parse_args()
+
+    failures = 0
+    for engine in ('mailbox', 'bitboard'):
+        positions = random_positions(engine, args.games, args.plies, args.seed)
+        print(f'{engine} engine, {len(positions)} positions')
+        evaluator_failures = check_evaluator(positions)
+        print(f'  Evaluator against score_board: {"ok" if not evaluator_failures else f"{evaluator_failures} differ"}')
+        batch_failures = check_batch(positions)
+        if batch_failures is None:
+            print('  BatchEvaluator: skipped, NumPy is not installed')
+        else:
+            print(f'  BatchEvaluator against GameState: {"ok" if not batch_failures else f"{batch_failures} differ"}')
+        failures += evaluator_failures + (batch_failures or 0)
+    if failures:
+        print(f'{failures} wrong scores')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
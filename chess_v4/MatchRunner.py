@@ -0,0 +1,222 @@
+"""
+Headless engine against engine matches, to check that a change didn't cost playing strength.
+Plays a number of games between two engine configurations in a pool of processes, writes every finished game to a PGN
+file and reports the score with an Elo difference (95% error bars), nodes per second, time per move and the average
+depth reached.
+
+Engines are given as comma separated options:
+    depth=N          search depth (default 3); with time, the deepest iteration to try
+    time=MS          time per move in milliseconds (iterative deepening), default fixed depth
+    check=W, mobility=W, king_zone=W   evaluator weights (see Evaluator)
+    quiescence=0|1   quiescence search at the horizon (default 1)
+    pvs=0|1          principal variation search (default 1)
+    aspiration=W     aspiration window in pawns around the previous iteration's score, 0 for none (default 0.5;
+                     only used with time, since a fixed depth search has no previous iteration)
+    null_move=0|1, lmr=0|1, check_extensions=0|1   null move pruning, late move reductions and check extensions
+                     (default 1 each); compare them with time to see the depth they gain
+
+    python MatchRunner.py --games 20
+    python MatchRunner.py --engine1 depth=3 --engine2 "depth=3,mobility=0.05" --games 100 --concurrency 8 --pgn match.pgn
+    python MatchRunner.py --engine1 "depth=10,time=500" --engine2 "depth=10,time=500,null_move=0,lmr=0,check_extensions=0"
+"""
+import argparse
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Chess.GameState import GameState
+from Chess.Evaluator import Evaluator
+from Chess import AI
+
+# option name -> type; see the module docstring
+ENGINE_OPTIONS = {'depth': int, 'time': int, 'check': float, 'mobility': float, 'king_zone': float, 'quiescence': int,
+                  'pvs': int, 'aspiration': float, 'null_move': int, 'lmr': int, 'check_extensions': int}
+
+# short openings in coordinate notation, each played twice with the colors swapped
+OPENINGS = [
+    ['e2e4', 'e7e5', 'g1f3', 'b8c6', 'f1b5'], # Ruy Lopez
+    ['e2e4', 'e7e5', 'g1f3', 'b8c6', 'f1c4'], # Italian game
+    ['e2e4', 'c7c5', 'g1f3', 'd7d6'], # Sicilian
+    ['e2e4', 'e7e6', 'd2d4', 'd7d5'], # French
+    ['e2e4', 'c7c6', 'd2d4', 'd7d5'], # Caro-Kann
+    ['d2d4', 'd7d5', 'c2c4', 'e7e6'], # Queen's gambit declined
+    ['d2d4', 'd7d5', 'c2c4', 'c7c6'], # Slav
+    ['d2d4', 'g8f6', 'c2c4', 'g7g6'], # King's Indian
+    ['c2c4', 'e7e5'], # English
+    ['g1f3', 'd7d5', 'g2g3'], # Reti
+]
+
+MAX_PLIES = 300 # games still going after this many plies are scored as draws
+
+
+# 'depth=3,time=500' -> {'depth': 3, 'time': 500}
+def parse_engine(spec):
+    config = {'depth': 3, 'time': None, 'quiescence': 1}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        name, _, value = item.partition('=')
+        name = name.strip()
+        if name not in ENGINE_OPTIONS:
+            raise ValueError(f'unknown engine option {name!r}, expected one of {", ".join(ENGINE_OPTIONS)}')
+        config[name] = ENGINE_OPTIONS[name](value)
+    return config
+
+
+def create_searcher(config):
+    weights = {'check_weight': config.get('check', 0.7), 'mobility_weight': config.get('mobility', 0.0),
+               'king_zone_weight': config.get('king_zone', 0.0)}
+    return AI.Searcher(evaluator = Evaluator(**weights), use_quiescence = bool(config['quiescence']),
+                       use_pvs = bool(config.get('pvs', 1)), aspiration_window = config.get('aspiration', AI.ASPIRATION_WINDOW),
+                       use_null_move = bool(config.get('null_move', 1)), use_late_move_reductions = bool(config.get('lmr', 1)),
+                       use_check_extensions = bool(config.get('check_extensions', 1)))
+
+
+# not enough material left for either side to mate: bare kings, or a single bishop or knight
+def insufficient_material(gs):
+    minor_pieces = 0
+    for row in gs.board:
+        for piece in row:
+            if piece[1] in 'PRQ':
+                return False
+            if piece[1] in 'BN':
+                minor_pieces += 1
+    return minor_pieces <= 1
+
+
+# runs in a worker process: play one game and return (game number, result, termination, pgn, stats) where result is
+# '1-0', '0-1' or '1/2-1/2' and stats maps 'white'/'black' to (moves, nodes, seconds, sum of the depths reached)
+def play_game(number, opening, white_name, white_config, black_name, black_config, generator):
+    gs = GameState(generator)
+    searchers = {True: create_searcher(white_config), False: create_searcher(black_config)}
+    configs = {True: white_config, False: black_config}
+    stats = {True: [0, 0, 0.0, 0], False: [0, 0, 0.0, 0]}
+    sans = []
+    seen = [gs.zobrist_key] # positions since the last capture or pawn move, for repetitions
+    result = None
+    termination = None
+    valid_moves = gs.get_valid_moves()
+    while result is None:
+        if gs.checkmate:
+            result = '0-1' if gs.white_to_move else '1-0'
+            termination = 'checkmate'
+            break
+        if gs.stalemate:
+            result, termination = '1/2-1/2', 'stalemate'
+            break
+        if len(sans) >= MAX_PLIES:
+            result, termination = '1/2-1/2', 'move limit'
+            break
+
+        if len(sans) < len(opening):
+            move = next(move for move in valid_moves if move.get_chess_notation() == opening[len(sans)])
+        else:
+            config = configs[gs.white_to_move]
+            search = searchers[gs.white_to_move].search(gs, valid_moves, config['depth'], config['time'])
+            move = search.best_move if search.best_move is not None else valid_moves[0]
+            side = stats[gs.white_to_move]
+            side[0] += 1
+            side[1] += search.stats.total_nodes()
+            side[2] += search.stats.elapsed
+            side[3] += search.depth
+        sans.append(gs.get_san(move))
+        gs.make_move(move)
+        valid_moves = gs.get_valid_moves()
+
+        if move.is_capture or move.piece_moved[1] == 'P':
+            seen = []
+        seen.append(gs.zobrist_key)
+        if seen.count(gs.zobrist_key) >= 3:
+            result, termination = '1/2-1/2', 'threefold repetition'
+        elif gs.halfmove_clock >= 100:
+            result, termination = '1/2-1/2', 'fifty move rule'
+        elif insufficient_material(gs):
+            result, termination = '1/2-1/2', 'insufficient material'
+
+    pgn = [f'[Event "MatchRunner"]', f'[Site "?"]', f'[Date "{time.strftime("%Y.%m.%d")}"]', f'[Round "{number}"]',
+           f'[White "{white_name}"]', f'[Black "{black_name}"]', f'[Result "{result}"]', f'[Termination "{termination}"]', '']
+    movetext = []
+    for i, san in enumerate(sans):
+        movetext.append(f'{i // 2 + 1}. {san}' if i % 2 == 0 else san)
+    movetext.append(result)
+    line = ''
+    for word in movetext: # PGN lines are kept under 80 characters
+        if len(line) + len(word) + 1 > 79:
+            pgn.append(line)
+            line = word
+        else:
+            line = f'{line} {word}' if line else word
+    pgn.append(line)
+    return number, result, termination, '\n'.join(pgn) + '\n\n', {'white': tuple(stats[True]), 'black': tuple(stats[False])}
+
+
+# Elo difference for a score fraction, clamped so a 100% score doesn't give infinity
+def elo_difference(score):
+    score = min(max(score, 1e-3), 1 - 1e-3)
+    return -400 * math.log10(1 / score - 1)
+
+
+# (elo, lower, upper) of engine1 against engine2 with a 95% confidence interval from the per game score deviation
+def elo_with_error(wins, draws, losses):
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return elo_difference(score), elo_difference(score - margin), elo_difference(score + margin)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'play engine configurations against each other')
+    parser.add_argument('--engine1', default = 'depth=3', help = 'options of the first engine (default depth=3)')
+    parser.add_argument('--engine2', default = 'depth=2', help = 'options of the second engine (default depth=2)')
+    parser.add_argument('--games', type = int, default = 20, help = 'number of games (default 20)')
+    parser.add_argument('--concurrency', type = int, default = os.cpu_count(), help = 'games played at once (default: CPU cores)')
+    parser.add_argument('--generator', choices = ['mailbox', 'bitboard'], default = 'bitboard', help = 'move generator')
+    parser.add_argument('--pgn', default = 'match.pgn', help = 'file the games are written to (default match.pgn)')
+    args = parser.parse_args()
+    engine1 = parse_engine(args.engine1)
+    engine2 = parse_engine(args.engine2)
+    name1 = f'engine1 ({args.engine1})'
+    name2 = f'engine2 ({args.engine2})'
+
+    wins = draws = losses = 0
+    totals = {name1: [0, 0, 0.0, 0], name2: [0, 0, 0.0, 0]} # moves, nodes, seconds, depths
+    with open(args.pgn, 'w') as pgn_file, ProcessPoolExecutor(max_workers = args.concurrency) as pool:
+        futures = {}
+        for number in range(1, args.games + 1):
+            opening = OPENINGS[(number - 1) // 2 % len(OPENINGS)]
+            if number % 2 == 1: # engine1 has white in odd games
+                future = pool.submit(play_game, number, opening, name1, engine1, name2, engine2, args.generator)
+            else:
+                future = pool.submit(play_game, number, opening, name2, engine2, name1, engine1, args.generator)
+            futures[future] = number % 2 == 1
+        for future in as_completed(futures):
+            engine1_white = futures[future]
+            number, result, termination, pgn, stats = future.result()
+            pgn_file.write(pgn)
+            pgn_file.flush()
+            if result == '1/2-1/2':
+                draws += 1
+            elif (result == '1-0') == engine1_white:
+                wins += 1
+            else:
+                losses += 1
+            for color, name in (('white', name1 if engine1_white else name2), ('black', name2 if engine1_white else name1)):
+                for i in range(4):
+                    totals[name][i] += stats[color][i]
+            print(f'game {number}: {result} ({termination}), engine1 {"white" if engine1_white else "black"}; '
+                  f'+{wins} ={draws} -{losses}')
+
+    elo, lower, upper = elo_with_error(wins, draws, losses)
+    print(f'{name1} against {name2}: +{wins} ={draws} -{losses}, '
+          f'score {(wins + draws / 2) / (wins + draws + losses):.3f}, Elo {elo:+.0f} [{lower:+.0f}, {upper:+.0f}]')
+    for name, (moves, nodes, seconds, depths) in totals.items():
+        print(f'  {name}: {moves} moves, {nodes / max(seconds, 1e-9):.0f} nodes/s, {1000 * seconds / max(moves, 1):.0f} ms per move, '
+              f'depth {depths / max(moves, 1):.2f}')
+    print(f'games written to {args.pgn}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
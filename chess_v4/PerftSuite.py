@@ -0,0 +1,162 @@
+"""
+Perft correctness suite and move generator benchmark.
+Counts the positions reachable from a set of standard test positions and compares them against the known values,
+reporting nodes per second for each. Exits with status 1 if any count is wrong.
+
+    python PerftSuite.py                      # every position up to depth 3 with both engines
+    python PerftSuite.py --depth 5 --engine bitboard
+    python PerftSuite.py --divide 3 --fen "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+    python PerftSuite.py --make-undo          # make/undo speed and the memory each made move holds on to
+"""
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from Chess.GameState import GameState
+
+# (name, fen, {depth: nodes}); values from the chessprogramming wiki perft results and Martin Sedlak's edge case list
+POSITIONS = [
+    ('start position', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ('en passant and pins', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ('promotions', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ('promotions mirrored', 'r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1',
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ('position 5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ('position 6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+    ('illegal en passant 1', '3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1',
+     {1: 18, 2: 92, 3: 1670, 4: 10138, 6: 1134888}),
+    ('illegal en passant 2', '8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1',
+     {1: 13, 2: 102, 3: 1266, 4: 10276, 6: 1015133}),
+    ('en passant gives check', '8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1',
+     {1: 15, 2: 126, 3: 1928, 4: 13931, 6: 1440467}),
+    ('short castle gives check', '5k2/8/8/8/8/8/8/4K2R w K - 0 1',
+     {1: 15, 2: 66, 3: 1198, 4: 6399, 6: 661072}),
+    ('long castle gives check', '3k4/8/8/8/8/8/8/R3K3 w Q - 0 1',
+     {1: 16, 2: 71, 3: 1286, 4: 7418, 6: 803711}),
+    ('castle rights', 'r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1',
+     {1: 26, 2: 1141, 3: 27826, 4: 1274206}),
+    ('castling prevented', 'r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1',
+     {1: 44, 2: 1494, 3: 50509, 4: 1720476}),
+    ('promote out of check', '2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1',
+     {1: 11, 2: 133, 3: 1442, 4: 19174, 6: 3821001}),
+    ('discovered check', '8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1',
+     {1: 29, 2: 165, 3: 5160, 4: 31961, 5: 1004658}),
+    ('promote to give check', '4k3/1P6/8/8/8/8/K7/8 w - - 0 1',
+     {1: 9, 2: 40, 3: 472, 4: 2661, 6: 217342}),
+    ('underpromote to give check', '8/P1k5/K7/8/8/8/8/8 w - - 0 1',
+     {1: 6, 2: 27, 3: 273, 4: 1329, 6: 92683}),
+    ('self stalemate', 'K1k5/8/P7/8/8/8/8/8 w - - 0 1',
+     {1: 2, 2: 6, 3: 13, 4: 63, 6: 2217}),
+    ('stalemate and checkmate', '8/k1P5/8/1K6/8/8/8/8 w - - 0 1',
+     {1: 10, 2: 25, 3: 268, 4: 926, 7: 567584}),
+    ('stalemate and checkmate 2', '8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1',
+     {1: 37, 2: 183, 3: 6559, 4: 23527}),
+    ('pawn pinned from behind', '4R3/4p3/8/8/4k3/8/8/4K3 b - - 0 1',
+     {1: 10, 2: 126, 3: 989, 4: 16531}),
+]
+
+
+# run every position at the deepest known depth up to max_depth; returns the number of wrong counts
+def run_suite(engine, max_depth):
+    failures = 0
+    total_nodes = 0
+    total_time = 0
+    print(f'{engine} engine, depth <= {max_depth}')
+    for name, fen, counts in POSITIONS:
+        depths = [depth for depth in counts if depth <= max_depth]
+        if not depths:
+            continue
+        depth = max(depths)
+        gs = GameState.from_fen(fen, engine)
+        start = time.perf_counter()
+        nodes = gs.perft(depth)
+        elapsed = time.perf_counter() - start
+        total_nodes += nodes
+        total_time += elapsed
+        status = 'ok' if nodes == counts[depth] else f'FAIL (expected {counts[depth]})'
+        if nodes != counts[depth]:
+            failures += 1
+        print(f'  {name:<28} depth {depth}  {nodes:>9} nodes  {elapsed:7.2f}s  {nodes / max(elapsed, 1e-9):>9.0f} nodes/s  {status}')
+    print(f'  total {total_nodes} nodes in {total_time:.2f}s, {total_nodes / max(total_time, 1e-9):.0f} nodes/s')
+    return failures
+
+
+# play a random line of moves from fen, then time making and taking it back and use tracemalloc to measure
+# how much memory each made move keeps alive until it is undone
+def benchmark_make_undo(engine, fen, plies = 60, repeat = 2000):
+    gs = GameState.from_fen(fen, engine)
+    rng = random.Random(1)
+    line = []
+    for _ in range(plies):
+        moves = gs.get_valid_moves()
+        if not moves:
+            break
+        line.append(rng.choice(moves))
+        gs.make_move(line[-1])
+    for _ in line:
+        gs.undo_move()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for move in line:
+        gs.make_move(move)
+    held = tracemalloc.get_traced_memory()[0] - before
+    for _ in line:
+        gs.undo_move()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for move in line:
+            gs.make_move(move)
+        for _ in line:
+            gs.undo_move()
+    elapsed = time.perf_counter() - start
+    pairs = repeat * len(line)
+    print(f'{engine} engine, {len(line)} move line: {held / len(line):.0f} bytes held per move made, '
+          f'{pairs / max(elapsed, 1e-9):.0f} make/undo pairs/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'perft correctness suite and move generator benchmark')
+    parser.add_argument('--depth', type = int, default = 3, help = 'maximum perft depth to run (default 3)')
+    parser.add_argument('--engine', choices = ['mailbox', 'bitboard', 'both'], default = 'both')
+    parser.add_argument('--divide', type = int, metavar = 'DEPTH', help = 'print the node count after each move of --fen')
+    parser.add_argument('--fen', default = POSITIONS[0][1], help = 'position for --divide and --make-undo')
+    parser.add_argument('--make-undo', action = 'store_true', help = 'benchmark make_move/undo_move instead of perft')
+    args = parser.parse_args()
+    engines = ['mailbox', 'bitboard'] if args.engine == 'both' else [args.engine]
+
+    if args.divide is not None:
+        for engine in engines:
+            counts = GameState.from_fen(args.fen, engine).divide(args.divide)
+            print(f'{engine} engine')
+            for move in sorted(counts):
+                print(f'  {move}: {counts[move]}')
+            print(f'  total: {sum(counts.values())}')
+        return 0
+
+    if args.make_undo:
+        for engine in engines:
+            benchmark_make_undo(engine, args.fen)
+        return 0
+
+    failures = 0
+    for engine in engines:
+        failures += run_suite(engine, args.depth)
+    if failures:
+        print(f'{failures} wrong perft counts')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
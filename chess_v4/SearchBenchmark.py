@@ -0,0 +1,87 @@
+"""
+Parallel search benchmark.
+Searches a set of test positions to a fixed depth with one process and with several, checks that both pick the same
+move and reports the nodes each process searched and the speedup over the single process search.
+The parallel search only splits the root moves, so every worker searches its moves without the bounds and the move
+ordering the others find. Expect it to lose to the single process search at small depths, where starting the jobs
+costs more than the search, and on a single CPU, where the workers can't run at the same time.
+
+    python SearchBenchmark.py                 # depth 3 with as many workers as there are CPU cores
+    python SearchBenchmark.py --depth 4 --workers 4 --engine bitboard
+    python SearchBenchmark.py --calls         # calls of the mailbox legality helpers per searched node
+"""
+import argparse
+import os
+import sys
+from Chess.GameState import GameState
+from Chess import AI
+
+POSITIONS = [
+    ('start position', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'),
+    ('position 6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10'),
+    ('italian game', 'r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3'),
+    ('endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1'),
+]
+
+
+# search fen with a new Searcher (empty transposition table and move ordering); the root moves are searched in
+# generation order so both searches see them in the same order
+def timed_search(fen, engine, depth, workers):
+    gs = GameState.from_fen(fen, engine)
+    searcher = AI.Searcher(shuffle_root_moves = False, workers = workers)
+    return searcher.search(gs, gs.get_valid_moves(), depth)
+
+
+# search every position with one process and the mailbox generator and count how often the legality helpers of
+# GameState run (GameState.count_calls), to see how much work is repeated for the same position
+def report_calls(depth):
+    GameState.count_calls = True
+    total_nodes = 0
+    for name, fen in POSITIONS:
+        result = timed_search(fen, 'mailbox', depth, 1)
+        total_nodes += result.stats.total_nodes()
+        print(f'{name}: {result.best_move}, {result.stats.total_nodes()} nodes')
+    GameState.count_calls = False
+    print(f'calls per node ({total_nodes} nodes):')
+    for name, calls in sorted(GameState.call_counts.items()):
+        print(f'  {name:<26} {calls / max(total_nodes, 1):6.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'compare the parallel search against the single process search')
+    parser.add_argument('--depth', type = int, default = 3, help = 'search depth (default 3)')
+    parser.add_argument('--workers', type = int, default = os.cpu_count(), help = 'worker processes (default: CPU cores)')
+    parser.add_argument('--engine', choices = ['mailbox', 'bitboard'], default = 'bitboard')
+    parser.add_argument('--calls', action = 'store_true', help = 'count the legality helper calls per node instead')
+    args = parser.parse_args()
+    if args.calls:
+        report_calls(args.depth)
+        return 0
+    timed_search(POSITIONS[0][1], args.engine, 1, args.workers) # start the worker processes before timing anything
+    mismatches = 0
+    serial_total = 0
+    parallel_total = 0
+    for name, fen in POSITIONS:
+        serial = timed_search(fen, args.engine, args.depth, 1)
+        parallel = timed_search(fen, args.engine, args.depth, args.workers)
+        serial_time = serial.stats.elapsed
+        parallel_time = parallel.stats.elapsed
+        serial_total += serial_time
+        parallel_total += parallel_time
+        status = 'same move' if serial.best_move == parallel.best_move else 'DIFFERENT MOVE'
+        if serial.best_move != parallel.best_move:
+            mismatches += 1
+        print(f'{name}: {serial.best_move} in {serial_time:.2f}s ({serial.stats.total_nodes()} nodes), {parallel.best_move} in '
+              f'{parallel_time:.2f}s ({parallel.stats.total_nodes()} nodes), speedup {serial_time / max(parallel_time, 1e-9):.2f}x, {status}')
+        print('  nodes per process: ' + ', '.join(f'{pid}: {nodes}' for pid, nodes in sorted(parallel.stats.worker_nodes.items())))
+    print(f'total speedup with {args.workers} workers: {serial_total / max(parallel_total, 1e-9):.2f}x')
+    AI.shutdown_worker_pool()
+    if mismatches:
+        print(f'{mismatches} positions where the parallel search picked a different move')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
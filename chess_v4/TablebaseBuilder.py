@@ -0,0 +1,52 @@
+"""
+Builds endgame tablebases (see Chess/Tablebase.py) into the tablebases folder, which ChessMain.py and UCI.py use when it
+exists. The tables a material can capture or promote into are built first.
+
+    python TablebaseBuilder.py KQvK KRvK KPvK
+    python TablebaseBuilder.py --probe "8/8/8/4k3/8/8/8/4K2R w - - 0 1"
+"""
+import argparse
+import sys
+from Chess.GameState import GameState
+from Chess.Tablebase import Tablebase, TABLEBASE_PATH, build_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'build endgame tablebases of up to 4 pieces')
+    parser.add_argument('materials', nargs = '*', help = 'materials to build, white pieces first, eg. KQvK KRvKP')
+    parser.add_argument('--path', default = TABLEBASE_PATH, help = f'folder of the tables (default {TABLEBASE_PATH})')
+    parser.add_argument('--engine', choices = ['mailbox', 'bitboard'], default = 'bitboard', help = 'move generator')
+    parser.add_argument('--probe', metavar = 'FEN', help = 'look up a position and its moves instead of building')
+    args = parser.parse_args()
+
+    if args.probe:
+        gs = GameState.from_fen(args.probe)
+        tablebase = Tablebase(args.path)
+        names = {1: 'win', 0: 'draw', -1: 'loss'}
+        probe = tablebase.probe(gs)
+        if probe is None:
+            print('not in the tablebases')
+            return 1
+        wdl, dtm = probe
+        print(f'{names[wdl]} for {"white" if gs.white_to_move else "black"}' + (f', mate in {dtm} plies' if dtm else ''))
+        for move in gs.get_valid_moves():
+            san = gs.get_san(move)
+            gs.make_move(move)
+            probe = tablebase.probe(gs)
+            gs.undo_move()
+            if probe is None:
+                print(f'  {san:8} not in the tablebases')
+                continue
+            wdl, dtm = probe
+            print(f'  {san:8} {names[-wdl]}' + (f' in {dtm + 1} plies' if dtm is not None else ''))
+        return 0
+
+    if not args.materials:
+        parser.error('no materials given')
+    for name in args.materials:
+        build_table(name, args.path, args.engine, report = print)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
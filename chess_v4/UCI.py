@@ -0,0 +1,198 @@
+"""
+Universal Chess Interface front end, so the engine can be used from chess GUIs and tournament managers.
+Reads UCI commands on stdin and answers on stdout; the search runs on a background thread so stop and isready are
+answered straight away.
+
+    python UCI.py                 # plays from book.bin while in book and from the tablebases folder if they exist
+    python UCI.py --book my.bin --tablebases tb
+
+Supported commands: uci, isready, ucinewgame, position [startpos | fen FEN] [moves ...],
+go [depth N] [movetime MS] [wtime MS] [btime MS] [winc MS] [binc MS] [movestogo N] [nodes N] [infinite], stop, quit
+"""
+import argparse
+import os
+import sys
+import threading
+from Chess.GameState import GameState
+from Chess.Evaluator import CHECKMATE
+from Chess.Tablebase import Tablebase, TABLEBASE_PATH
+from Chess import AI
+
+ENGINE_NAME = 'chess_v4'
+GENERATOR = 'bitboard' # move generator used for the searched positions
+MAX_DEPTH = AI.MAX_PLY
+DEFAULT_MOVES_TO_GO = 30 # moves the remaining clock time is split over when the GUI doesn't say
+TIME_MARGIN = 50 # milliseconds kept back for the GUI and process overhead
+BOOK_PATH = 'book.bin'
+
+
+class UCIEngine:
+    def __init__(self, output = sys.stdout, tablebase = None):
+        self.output = output
+        self.output_lock = threading.Lock() # info lines come from the search thread
+        self.tablebase = tablebase
+        self.searcher = AI.Searcher(tablebase = tablebase)
+        self.gs = GameState(GENERATOR)
+        self.search = None # AI.BackgroundSearch of the current go command
+        self.pending_bestmove = None # move of a go infinite that finished, held back until stop (or quit)
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    # handle one command line; returns False on quit
+    def handle(self, line):
+        words = line.split()
+        if not words:
+            return True
+        command = words[0]
+        if command == 'uci':
+            self.send(f'id name {ENGINE_NAME}')
+            self.send('id author chess_v4 authors')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'ucinewgame':
+            self.stop_search()
+            self.searcher = AI.Searcher(tablebase = self.tablebase)
+            self.gs = GameState(GENERATOR)
+        elif command == 'position':
+            self.stop_search()
+            self.set_position(words[1:])
+        elif command == 'go':
+            self.stop_search()
+            self.go(words[1:])
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'quit':
+            self.stop_search()
+            return False
+        return True # unknown commands (and setoption, which has no options to set) are ignored
+
+    # position startpos moves e2e4 e7e5 / position fen <6 fields> moves ...
+    def set_position(self, words):
+        if words and words[0] == 'fen':
+            fen_words = words[1:words.index('moves')] if 'moves' in words else words[1:]
+            self.gs = GameState.from_fen(' '.join(fen_words), GENERATOR)
+        else:
+            self.gs = GameState(GENERATOR)
+        if 'moves' in words:
+            for notation in words[words.index('moves') + 1:]:
+                move = find_move(self.gs, notation)
+                if move is None:
+                    self.send(f'info string illegal move {notation}')
+                    break
+                self.gs.make_move(move)
+
+    def go(self, words):
+        params = {}
+        i = 0
+        while i < len(words):
+            if words[i] == 'infinite':
+                params['infinite'] = True
+                i += 1
+            elif i + 1 < len(words):
+                try:
+                    params[words[i]] = int(words[i + 1])
+                except ValueError:
+                    pass
+                i += 2
+            else:
+                i += 1
+
+        # go infinite must not answer before stop, even when the search ends by itself (eg. at MAX_DEPTH in a mate)
+        infinite = 'infinite' in params
+
+        def send_bestmove(notation):
+            if infinite:
+                self.pending_bestmove = notation
+            else:
+                self.send(f'bestmove {notation}')
+
+        valid_moves = self.gs.get_valid_moves()
+        if not valid_moves:
+            send_bestmove('0000')
+            return
+        book_move = AI.find_book_move(self.gs, valid_moves)
+        if book_move is not None:
+            send_bestmove(book_move.get_chess_notation())
+            return
+        fallback = valid_moves[0] # played if the search is stopped before depth 1 is done
+
+        def report(result):
+            self.send(self.info_line(result))
+
+        def on_done(result):
+            move = result.best_move if result.best_move is not None else fallback
+            send_bestmove(move.get_chess_notation())
+
+        max_depth = params.get('depth', MAX_DEPTH)
+        time_limit = None if infinite else allocate_time(params, self.gs.white_to_move)
+        self.search = AI.BackgroundSearch(self.searcher, self.gs, max_depth, time_limit, on_done = on_done,
+                                          node_limit = params.get('nodes'), report = report, iterative_deepening = True)
+
+    # stop the running search; its bestmove (or the held back one of a finished go infinite) is sent before this returns
+    def stop_search(self):
+        if self.search is not None:
+            self.search.stop()
+            self.search = None
+        if self.pending_bestmove is not None:
+            self.send(f'bestmove {self.pending_bestmove}')
+            self.pending_bestmove = None
+
+    def info_line(self, result):
+        stats = result.stats
+        if abs(result.score) >= CHECKMATE: # mate scores don't hold the distance, the principal variation ends in the mate
+            moves = (len(result.principal_variation) + 1) // 2
+            score = f'mate {moves if result.score > 0 else -moves}'
+        elif abs(result.score) > AI.TABLEBASE_WIN - 1: # tablebase scores hold the plies to mate
+            moves = (round((AI.TABLEBASE_WIN - abs(result.score)) * 1000) + 1) // 2
+            score = f'mate {moves if result.score > 0 else -moves}'
+        else:
+            score = f'cp {round(result.score * 100)}'
+        pv = ' '.join(move.get_chess_notation() for move in result.principal_variation)
+        return f'info depth {result.depth} score {score} nodes {stats.total_nodes()} nps {stats.nps():.0f} ' \
+               f'time {stats.elapsed * 1000:.0f} hashfull {self.searcher.transposition_table.hashfull()} pv {pv}'
+
+
+# the legal move with this coordinate notation (eg. 'e2e4', 'e7e8q'), or None
+def find_move(gs, notation):
+    for move in gs.get_valid_moves():
+        if move.get_chess_notation() == notation:
+            return move
+    return None
+
+
+# milliseconds to spend on this move, from go movetime or the clock (wtime/btime, winc/binc, movestogo); None if the
+# search should only stop on depth, nodes or stop
+def allocate_time(params, white_to_move):
+    if 'movetime' in params:
+        return max(1, params['movetime'] - TIME_MARGIN)
+    remaining = params.get('wtime' if white_to_move else 'btime')
+    if remaining is None:
+        return None
+    increment = params.get('winc' if white_to_move else 'binc', 0)
+    moves_to_go = params.get('movestogo', DEFAULT_MOVES_TO_GO)
+    budget = remaining / max(moves_to_go, 1) + increment * 3 // 4
+    return max(1, min(budget, remaining - TIME_MARGIN))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'run the engine as a UCI engine on stdin/stdout')
+    parser.add_argument('--book', default = BOOK_PATH, help = f'opening book, used if the file exists (default {BOOK_PATH})')
+    parser.add_argument('--tablebases', default = TABLEBASE_PATH,
+                        help = f'endgame tablebase folder, used if it exists (default {TABLEBASE_PATH})')
+    args = parser.parse_args()
+    if os.path.exists(args.book):
+        AI.load_opening_book(args.book)
+    engine = UCIEngine(tablebase = Tablebase(args.tablebases) if os.path.isdir(args.tablebases) else None)
+    for line in sys.stdin:
+        if not engine.handle(line.strip()):
+            break
+    engine.stop_search()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())